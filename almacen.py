@@ -0,0 +1,164 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from cache_disco import CacheDisco, clave_valida
+
+# Límite de memoria para los datasets procesados que viven en el servidor
+LIMITE_MEMORIA_MB = int(os.environ.get('MAPA_LIMITE_MEMORIA_MB', '1024'))
+
+
+def calcular_clave(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def tamano_objeto(obj):
+    # Estimación de bytes ocupados por un dataset y sus estructuras derivadas
+    if obj is None:
+        return 0
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(tamano_objeto(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(tamano_objeto(v) for v in obj)
+    return 0
+
+
+def bytes_columnas(df, base=None):
+    # Bytes por columna. Con la medida de un dataset base del que df es
+    # continuación, las columnas de objetos (las únicas que exigen recorrer
+    # cada valor) solo miden sus filas nuevas
+    if base is None:
+        return df.memory_usage(index=True, deep=True)
+    memoria = df.memory_usage(index=True, deep=False)
+    for columna in df.columns:
+        serie = df[columna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            memoria[columna] = serie.memory_usage(index=False, deep=True)
+        elif serie.dtype == object and columna in base.memoria.index:
+            nuevas = serie.iloc[len(base.df):]
+            memoria[columna] = base.memoria[columna] + nuevas.memory_usage(index=False, deep=True)
+        elif serie.dtype == object:
+            memoria[columna] = serie.memory_usage(index=False, deep=True)
+    return memoria
+
+
+class ConjuntoDatos:
+    def __init__(self, clave, df, colores, base=None):
+        self.clave = clave
+        self.df = df
+        self.colores = colores
+        self.derivados = {}
+        # Se mide una vez al guardar el dataset y cada derivado: medir en cada
+        # consulta recorre todas las columnas de texto
+        self.memoria = bytes_columnas(df, base)
+        self.nbytes = int(self.memoria.sum())
+
+    def agregar_derivados(self, derivados):
+        for nombre, objeto in derivados.items():
+            self.nbytes += tamano_objeto(objeto) - tamano_objeto(self.derivados.get(nombre))
+            self.derivados[nombre] = objeto
+
+    def derivado(self, nombre, constructor):
+        # Estructuras calculadas una vez a partir del dataset (índices, agregados...)
+        if nombre not in self.derivados:
+            self.agregar_derivados({nombre: constructor(self.df)})
+        return self.derivados[nombre]
+
+
+class AlmacenDatos:
+    """Registro en memoria de los datasets procesados, con expulsión LRU.
+
+    Si tiene un respaldo (la caché en disco), cada dataset guardado se escribe
+    también allí y los que no están en memoria se recuperan de él.
+    """
+
+    def __init__(self, limite_bytes=LIMITE_MEMORIA_MB * 1024 * 1024, respaldo=None):
+        self.limite_bytes = limite_bytes
+        self.respaldo = respaldo
+        self._entradas = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, clave):
+        if not clave_valida(clave):
+            return False
+        with self._lock:
+            if clave in self._entradas:
+                return True
+        return self.respaldo is not None and self.respaldo.existe(clave)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entradas)
+
+    @property
+    def bytes_usados(self):
+        with self._lock:
+            return sum(c.nbytes for c in self._entradas.values())
+
+    def guardar(self, clave, df, colores, persistir=True, base=None):
+        # base: conjunto del que df es continuación (modo anexar); en disco
+        # solo se escriben las filas nuevas. La base sigue siendo válida para
+        # otras sesiones y workers, así que sus derivados se conservan.
+        if persistir and self.respaldo is not None:
+            if base is None:
+                self.respaldo.guardar(clave, df, colores)
+            else:
+                self.respaldo.guardar_anexo(clave, base.clave, df, base.df, colores)
+        conjunto = ConjuntoDatos(clave, df, colores, base)
+        with self._lock:
+            self._entradas[clave] = conjunto
+            self._entradas.move_to_end(clave)
+            self._expulsar()
+        return conjunto
+
+    def obtener(self, clave):
+        # La clave llega del cliente (dcc.Store o parámetro de la exportación)
+        if not clave_valida(clave):
+            return None
+        with self._lock:
+            conjunto = self._entradas.get(clave)
+            if conjunto is not None:
+                self._entradas.move_to_end(clave)
+                return conjunto
+        if self.respaldo is None:
+            return None
+        cargado = self.respaldo.cargar(clave)
+        if cargado is None:
+            return None
+        df, colores = cargado
+        conjunto = self.guardar(clave, df, colores, persistir=False)
+        conjunto.agregar_derivados(self.respaldo.cargar_derivados(clave))
+        return conjunto
+
+    def persistir_derivados(self, conjunto, nombres):
+        if self.respaldo is None:
+            return
+        for nombre in nombres:
+            if nombre in conjunto.derivados:
+                self.respaldo.guardar_derivado(conjunto.clave, nombre, conjunto.derivados[nombre])
+
+    def eliminar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def _expulsar(self):
+        # El dataset más reciente se conserva aunque supere el límite por sí solo
+        total = self.bytes_usados
+        while total > self.limite_bytes and len(self._entradas) > 1:
+            _, expulsado = self._entradas.popitem(last=False)
+            total -= expulsado.nbytes
+
+
+almacen = AlmacenDatos(respaldo=CacheDisco())
@@ -1,11 +1,17 @@
+import multiprocessing
 from dash import Dash
 import dash_bootstrap_components as dbc
 from layout import crear_layout
 from callbacks import registrar_callbacks
+from tareas import gestor_tareas
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 app.layout = crear_layout()
-registrar_callbacks(app)
+registrar_callbacks(app, gestor_tareas())
+
+# Objeto WSGI para producción (ver wsgi.py y gunicorn.conf.py)
+server = app.server
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Pool de procesos en el ejecutable de PyInstaller
     app.run_server(debug=True, port=8050)
\ No newline at end of file
@@ -0,0 +1,138 @@
+// Callbacks que se resuelven en el navegador: los datos ya están en la
+// figura o en un dcc.Store, así que no hace falta ir al servidor.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    mapa: {
+        mostrar_detalles: function(clickData) {
+            if (!clickData || !clickData.points.length || !clickData.points[0].customdata) {
+                return "Seleccione un punto en el mapa para ver detalles";
+            }
+            var d = clickData.points[0].customdata;
+            var p = function(texto) {
+                return {type: 'P', namespace: 'dash_html_components', props: {children: texto}};
+            };
+            // FechaCreacion llega como AAAA-MM-DDTHH:MM:SS
+            var f = d[3] || '';
+            var fecha = f ? f.slice(8, 10) + '/' + f.slice(5, 7) + '/' + f.slice(0, 4) + ' ' + f.slice(11, 16) : '';
+            var ubicacion = d[6];
+            return {type: 'Div', namespace: 'dash_html_components', props: {children: [
+                {type: 'H4', namespace: 'dash_html_components', props: {children: 'Detalles de la Instalación'}},
+                p('Técnico: ' + d[0]),
+                p('OT: ' + d[1]),
+                p('Nodo: ' + d[2]),
+                p('Fecha Creación: ' + fecha),
+                p('Latitud: ' + Number(d[4]).toFixed(5) + '    Longitud: ' + Number(d[5]).toFixed(5)),
+                ubicacion ? p({type: 'A', namespace: 'dash_html_components', props: {
+                    children: 'Ver en Google Maps',
+                    href: ubicacion,
+                    target: '_blank',
+                    style: {color: 'blue', textDecoration: 'underline'}
+                }}) : p('Ubicación no disponible')
+            ]}};
+        },
+
+        horas_disponibles: function(fecha, horasPorFecha) {
+            if (!fecha) {
+                return [[], null, true];
+            }
+            var horas = (horasPorFecha || {})[fecha] || [];
+            return [horas.map(function(h) { return {label: h, value: h}; }), null, false];
+        },
+
+        enlace_exportar: function(formato, tecnicos, ot, nodo, fecha, hora, zona, datos) {
+            if (!datos || !datos.clave) {
+                return '';
+            }
+            var parametros = new URLSearchParams({clave: datos.clave});
+            (tecnicos || []).forEach(function(t) { parametros.append('tecnico', t); });
+            [['ot', ot], ['nodo', nodo], ['fecha', fecha], ['hora', hora]].forEach(function(par) {
+                if (par[1]) { parametros.append(par[0], par[1]); }
+            });
+            if (zona) { parametros.append('zona', JSON.stringify(zona)); }
+            return '/exportar/' + formato + '?' + parametros.toString();
+        },
+
+        reproducir: function(n_intervals, n_clicks, valor, detenido, datos, estado) {
+            // Botón: pausa o reanuda (desde el inicio si ya terminó).
+            // Intervalo: avanza un fotograma y se detiene en el último.
+            var sinCambio = window.dash_clientside.no_update;
+            if (!datos || !estado || estado.modo !== 'reproduccion') {
+                return [sinCambio, true, 'Reproducir'];
+            }
+            var ultimo = datos.limites.length - 1;
+            var disparador = window.dash_clientside.callback_context.triggered[0].prop_id;
+            if (disparador.indexOf('boton-reproducir') === 0) {
+                if (!detenido) {
+                    return [sinCambio, true, 'Reproducir'];
+                }
+                return [valor >= ultimo ? 0 : sinCambio, false, 'Pausa'];
+            }
+            var siguiente = Math.min((valor || 0) + 1, ultimo);
+            var fin = siguiente >= ultimo;
+            return [siguiente, fin, fin ? 'Reproducir' : 'Pausa'];
+        },
+
+        mostrar_fotograma: function(valor, datos, mostrado, estado, figura) {
+            // Avanzar envía al mapa solo los puntos nuevos con extendData;
+            // retroceder (o el primer fotograma) rearma la figura desde datos
+            var sinCambio = window.dash_clientside.no_update;
+            if (!datos || !estado || estado.modo !== 'reproduccion' || !figura) {
+                return [sinCambio, sinCambio, sinCambio, sinCambio];
+            }
+            valor = Math.min(valor || 0, datos.limites.length - 1);
+            var hasta = datos.limites[valor];
+            var desde = (mostrado === null || mostrado === undefined) ? -1 : datos.limites[mostrado];
+            var etiqueta = datos.etiquetas[valor];
+            if (hasta === desde) {
+                return [sinCambio, sinCambio, valor, etiqueta];
+            }
+            var rearmar = desde < 0 || hasta < desde;
+            var tramo = tramo_reproduccion(datos, rearmar ? 0 : desde, hasta);
+            if (!rearmar) {
+                return [[tramo.cambios, tramo.indices], sinCambio, valor, etiqueta];
+            }
+            var trazas = figura.data.map(function(traza) {
+                return Object.assign({}, traza, {lat: [], lon: [], text: [], hovertext: [], customdata: [],
+                                                 marker: Object.assign({}, traza.marker, {color: []})});
+            });
+            tramo.indices.forEach(function(indice, i) {
+                var traza = trazas[indice];
+                traza.lat = tramo.cambios.lat[i];
+                traza.lon = tramo.cambios.lon[i];
+                traza.text = tramo.cambios.text[i];
+                traza.hovertext = tramo.cambios.hovertext[i];
+                traza.customdata = tramo.cambios.customdata[i];
+                traza.marker.color = tramo.cambios['marker.color'][i];
+            });
+            return [sinCambio, Object.assign({}, figura, {data: trazas}), valor, etiqueta];
+        }
+    }
+});
+
+// Puntos desde..hasta de la reproducción repartidos por traza, con la forma
+// de extendData: la traza 0 recibe los puntos y la de cada técnico su línea
+function tramo_reproduccion(datos, desde, hasta) {
+    var porTraza = {};
+    var agregar = function(indice, i, completo) {
+        var t = porTraza[indice] || (porTraza[indice] = {
+            lat: [], lon: [], text: [], hovertext: [], customdata: [], 'marker.color': []
+        });
+        t.lat.push(datos.lat[i]);
+        t.lon.push(datos.lon[i]);
+        if (completo) {
+            t.text.push(datos.texto[i]);
+            t.hovertext.push(datos.hovertext[i]);
+            t.customdata.push(datos.customdata[i]);
+            t['marker.color'].push(datos.color[i]);
+        }
+    };
+    for (var i = desde; i < hasta; i++) {
+        agregar(0, i, true);
+        agregar(datos.traza[i], i, false);
+    }
+    var indices = Object.keys(porTraza).map(Number);
+    var cambios = {};
+    ['lat', 'lon', 'text', 'hovertext', 'customdata', 'marker.color'].forEach(function(campo) {
+        cambios[campo] = indices.map(function(indice) { return porTraza[indice][campo]; });
+    });
+    return {indices: indices, cambios: cambios};
+}
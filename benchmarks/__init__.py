@@ -0,0 +1,3 @@
+# Benchmarks de las etapas de carga y del mapa. Uso:
+#   python -m benchmarks.ejecutar --filas 1000 10000 100000
+#   python -m benchmarks.generador 50000 instalaciones.xlsx
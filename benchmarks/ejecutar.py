@@ -0,0 +1,241 @@
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from almacen import ConjuntoDatos, almacen, calcular_clave
+from benchmarks.generador import generar_instalaciones, guardar_libro
+from cache_disco import CacheDisco
+from indice import obtener_indice
+from ingesta import COLUMNA_TECNICO, COLUMNAS_USADAS, leer_bloques
+from metricas_rutas import obtener_metricas
+from niveles import obtener_rejilla
+from utilities import (ajustar_coordenadas, convertir_fechas, convertir_fechas_columna,
+                       normalizar_tecnicos, parse_coord, parse_coord_columna)
+
+TAMANOS = (1000, 10000, 100000, 1000000)
+# Las versiones fila a fila se miden solo hasta este tamaño
+LIMITE_POR_FILA = 100000
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados')
+
+
+def medir(funcion, repeticiones=1):
+    # Mejor tiempo de varias repeticiones y el resultado de la última
+    mejor = None
+    for _ in range(repeticiones):
+        gc.collect()
+        inicio = time.perf_counter()
+        resultado = funcion()
+        transcurrido = time.perf_counter() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor, resultado
+
+
+# Callback que atiende el botón "filtrar"
+SALIDA_MAPA = '..mapa.figure...estado-mapa.data..'
+
+
+def peticion_mapa(app, cliente, clave, tipo_ruta='individuales', tecnicos=None):
+    # Misma petición que hace el navegador al pulsar "filtrar". Entradas y
+    # estados salen de app.callback_map, con el valor que tienen en el layout
+    # salvo los que fija el benchmark, para que un Input nuevo no la rompa
+    callback = app.callback_map[SALIDA_MAPA]
+    layout = app.layout() if callable(app.layout) else app.layout
+    componentes = {c.id: c for c in layout._traverse() if isinstance(getattr(c, 'id', None), str)}
+    fijos = {
+        'boton-filtrar.n_clicks': 1,
+        'tipo-ruta.value': tipo_ruta,
+        'filtro-tecnico.value': tecnicos,
+        'stored-data.data': {'clave': clave},
+    }
+    
+    def valores(dependencias):
+        resultado = []
+        for dependencia in dependencias:
+            nombre = f"{dependencia['id']}.{dependencia['property']}"
+            valor = fijos[nombre] if nombre in fijos else getattr(
+                componentes.get(dependencia['id']), dependencia['property'], None
+            )
+            resultado.append({**dependencia, 'value': valor})
+        return resultado
+    
+    cuerpo = {
+        'output': SALIDA_MAPA,
+        'outputs': [{'id': o.component_id, 'property': o.component_property} for o in callback['output']],
+        'inputs': valores(callback['inputs']),
+        'state': valores(callback['state']),
+        'changedPropIds': ['boton-filtrar.n_clicks'],
+    }
+    respuesta = cliente.post('/_dash-update-component', json=cuerpo)
+    if respuesta.status_code != 200:
+        raise RuntimeError(f"actualizar_mapa respondió {respuesta.status_code}")
+    return respuesta.data
+
+
+def medir_tamano(filas, args, app, cliente):
+    resultados = {}
+    
+    def registrar(etapa, segundos, **extra):
+        resultados[etapa] = {'segundos': round(segundos, 6), **extra}
+        print(f"  {etapa:<28} {segundos:10.4f} s")
+    
+    crudo = generar_instalaciones(filas, args.tecnicos, args.duplicados, args.comas,
+                                  args.am_pm, semilla=args.semilla)
+    
+    if args.sin_excel:
+        bloque = crudo[COLUMNAS_USADAS].astype(object)
+    else:
+        buffer = io.BytesIO()
+        guardar_libro(crudo, buffer)
+        libro = buffer.getvalue()
+        segundos, bloques = medir(
+            lambda: [b for b, _ in leer_bloques(io.BytesIO(libro), 'benchmark.xlsx')], args.repeticiones
+        )
+        registrar('lectura_excel', segundos, bytes=len(libro))
+        bloque = pd.concat(bloques, ignore_index=True)
+    
+    por_fila = filas <= args.limite_por_fila
+    if por_fila:
+        segundos, _ = medir(lambda: bloque['FechaCreacion'].apply(convertir_fechas), args.repeticiones)
+        registrar('convertir_fechas', segundos)
+    segundos, (fechas, _) = medir(lambda: convertir_fechas_columna(bloque['FechaCreacion']), args.repeticiones)
+    registrar('convertir_fechas_columna', segundos)
+    
+    if por_fila:
+        segundos, _ = medir(
+            lambda: (bloque['Latitud'].apply(parse_coord), bloque['Longitud'].apply(parse_coord)),
+            args.repeticiones
+        )
+        registrar('parse_coord', segundos)
+    segundos, (lat, lon) = medir(
+        lambda: (parse_coord_columna(bloque['Latitud']), parse_coord_columna(bloque['Longitud'])),
+        args.repeticiones
+    )
+    registrar('parse_coord_columna', segundos)
+    
+    segundos, tecnicos = medir(lambda: normalizar_tecnicos(bloque[COLUMNA_TECNICO]), args.repeticiones)
+    registrar('normalizar_tecnicos', segundos)
+    
+    df = bloque.assign(Latitud=lat, Longitud=lon, FechaCreacion=fechas, Tecnico_Clean=tecnicos)
+    segundos, df = medir(lambda: ajustar_coordenadas(df), args.repeticiones)
+    registrar('ajuste', segundos)
+    colores = {t: '#1f77b4' for t in df['Tecnico_Clean'].cat.categories}
+    
+    # Ida y vuelta del dataset por el almacén: escritura en la caché en disco
+    # y lectura con memory-mapping, como al volver a abrir el archivo
+    with tempfile.TemporaryDirectory() as directorio:
+        cache = CacheDisco(directorio)
+        clave = calcular_clave(b'benchmark')
+        
+        def ida_vuelta():
+            cache.eliminar(clave)
+            cache.guardar(clave, df, colores)
+            cargado, _ = cache.cargar(clave)
+            return cargado
+        segundos, cargado = medir(ida_vuelta, args.repeticiones)
+        ocupado = sum(os.path.getsize(os.path.join(raiz, a))
+                      for raiz, _, archivos in os.walk(directorio) for a in archivos)
+        registrar('almacen_ida_vuelta', segundos, bytes=ocupado,
+                  bytes_stored_data=len(json.dumps({'clave': 'x' * 64})))
+        del cargado
+    
+    def derivados():
+        conjunto = ConjuntoDatos(calcular_clave(b'benchmark'), df, colores)
+        obtener_indice(conjunto)
+        obtener_rejilla(conjunto)
+        obtener_metricas(conjunto)
+        return conjunto
+    segundos, conjunto = medir(derivados, args.repeticiones)
+    registrar('indices', segundos, bytes=conjunto.nbytes)
+    
+    clave = calcular_clave(f"benchmark-{filas}".encode())
+    conjunto = almacen.guardar(clave, df, colores, persistir=False)
+    conjunto.agregar_derivados(derivados().derivados)
+    segundos, figura = medir(lambda: peticion_mapa(app, cliente, clave), args.repeticiones)
+    registrar('actualizar_mapa', segundos, bytes=len(figura))
+    primero = [str(df['Tecnico_Clean'].cat.categories[0])]
+    segundos, figura = medir(lambda: peticion_mapa(app, cliente, clave, tecnicos=primero), args.repeticiones)
+    registrar('actualizar_mapa_tecnico', segundos, bytes=len(figura))
+    almacen.eliminar(clave)
+    return resultados
+
+
+def version_repositorio():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+            cwd=os.path.dirname(DIRECTORIO_RESULTADOS), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(anterior, actual):
+    print(f"\nComparación con {anterior['version'] or '?'} ({anterior['fecha']}):")
+    for filas, etapas in actual['resultados'].items():
+        previas = anterior['resultados'].get(filas, {})
+        for etapa, medida in etapas.items():
+            if etapa in previas and previas[etapa]['segundos'] > 0:
+                razon = medida['segundos'] / previas[etapa]['segundos']
+                aviso = '  <-- más lento' if razon > 1.2 else ''
+                print(f"  {filas:>8} {etapa:<28} x{razon:6.2f}{aviso}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide cada etapa de la carga y del mapa.")
+    parser.add_argument('--filas', type=int, nargs='+', default=list(TAMANOS))
+    parser.add_argument('--repeticiones', type=int, default=1)
+    parser.add_argument('--sin-excel', action='store_true',
+                        help="No escribir ni leer el libro (la lectura domina a partir de 100k filas)")
+    parser.add_argument('--limite-por-fila', type=int, default=LIMITE_POR_FILA,
+                        help="Tamaño máximo para medir convertir_fechas y parse_coord fila a fila")
+    parser.add_argument('--tecnicos', type=int, default=20)
+    parser.add_argument('--duplicados', type=float, default=0.2)
+    parser.add_argument('--comas', type=float, default=0.3)
+    parser.add_argument('--am-pm', type=float, default=0.5)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default=None, help="Archivo JSON de resultados")
+    parser.add_argument('--comparar', default=None, help="Resultados anteriores para comparar")
+    args = parser.parse_args(argv)
+    
+    from app import app
+    cliente = app.server.test_client()
+    
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'version': version_repositorio(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'parametros': {k: v for k, v in vars(args).items() if k not in ('salida', 'comparar')},
+        'resultados': {},
+    }
+    for filas in args.filas:
+        print(f"{filas} filas")
+        informe['resultados'][str(filas)] = medir_tamano(filas, args, app, cliente)
+    
+    salida = args.salida or os.path.join(
+        DIRECTORIO_RESULTADOS, f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(informe, archivo, indent=2, ensure_ascii=False)
+    print(f"Resultados en {salida}")
+    
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            comparar(json.load(archivo), informe)
+
+
+if __name__ == '__main__':
+    main()
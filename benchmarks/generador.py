@@ -0,0 +1,118 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from ingesta import COLUMNA_TECNICO
+
+NOMBRES = ['Juan', 'María', 'Pedro', 'Luis', 'Ana', 'Carlos', 'Sofía', 'Andrés', 'Camila', 'Jorge']
+APELLIDOS = ['Pérez', 'Gómez', 'Rodríguez', 'Martínez', 'López', 'Díaz', 'Ramírez', 'Torres']
+# Centro aproximado de la zona de operación (Bogotá)
+CENTRO = (4.65, -74.1)
+
+
+def _variantes(nombre, rng):
+    # Los libros reales traen el mismo técnico escrito de varias formas
+    variantes = [nombre, nombre.upper(), f" {nombre.lower()} ", nombre.replace(' ', '  ')]
+    return variantes[rng.integers(len(variantes))]
+
+
+def generar_instalaciones(filas, tecnicos=20, proporcion_duplicados=0.2, proporcion_comas=0.3,
+                          proporcion_am_pm=0.5, dias=30, semilla=0):
+    """DataFrame con las columnas y los formatos del libro de instalaciones.
+
+    proporcion_duplicados es la fracción de filas que repite las coordenadas
+    de otra fila (postes con varias instalaciones), proporcion_comas la de
+    coordenadas escritas como texto con coma decimal y proporcion_am_pm la de
+    fechas con "a. m."/"p. m." en lugar de formato de 24 horas.
+    """
+    rng = np.random.default_rng(semilla)
+    nombres = [f"{NOMBRES[i % len(NOMBRES)]} {APELLIDOS[(i // len(NOMBRES)) % len(APELLIDOS)]}"
+               + (f" {i // (len(NOMBRES) * len(APELLIDOS))}" if i >= len(NOMBRES) * len(APELLIDOS) else '')
+               for i in range(tecnicos)]
+    tecnico = rng.integers(tecnicos, size=filas)
+    escritos = np.array([_variantes(nombres[t], rng) for t in tecnico], dtype=object)
+    
+    # Cada técnico trabaja alrededor de su propia zona
+    zona = rng.normal(0, 0.08, size=(tecnicos, 2))
+    lat = np.round(CENTRO[0] + zona[tecnico, 0] + rng.normal(0, 0.01, filas), 6)
+    lon = np.round(CENTRO[1] + zona[tecnico, 1] + rng.normal(0, 0.01, filas), 6)
+    # Las coordenadas repetidas se copian de otra fila del mismo técnico
+    duplicados = np.flatnonzero(rng.random(filas) < proporcion_duplicados)
+    if filas > 1 and duplicados.size:
+        orden = np.argsort(tecnico, kind='stable')
+        inicio = np.searchsorted(tecnico[orden], tecnico[duplicados])
+        cantidad = np.bincount(tecnico, minlength=tecnicos)[tecnico[duplicados]]
+        origen = orden[inicio + (rng.random(duplicados.size) * cantidad).astype(np.int64)]
+        lat[duplicados] = lat[origen]
+        lon[duplicados] = lon[origen]
+    
+    latitud = lat.astype(object)
+    longitud = lon.astype(object)
+    comas = rng.random(filas) < proporcion_comas
+    latitud[comas] = np.char.replace(lat[comas].astype(str), '.', ',')
+    longitud[comas] = np.char.replace(lon[comas].astype(str), '.', ',')
+    
+    # Jornadas de 7:00 a 18:00
+    fechas = (pd.Timestamp('2024-01-01')
+              + pd.to_timedelta(rng.integers(dias, size=filas), unit='D')
+              + pd.to_timedelta(rng.integers(7 * 3600, 18 * 3600, size=filas), unit='s'))
+    am_pm = rng.random(filas) < proporcion_am_pm
+    texto_fechas = np.asarray(fechas.strftime('%d/%m/%Y %H:%M:%S'), dtype=object)
+    doce_horas = fechas[am_pm]
+    texto_fechas[am_pm] = (
+        doce_horas.strftime('%d/%m/%Y %I:%M:%S ')
+        + np.where(doce_horas.hour < 12, 'a. m.', 'p. m.')
+    )
+    
+    df = pd.DataFrame({
+        COLUMNA_TECNICO: escritos,
+        '2.Nro de O.T.': rng.integers(100000, 999999, size=filas),
+        '1.NODO DEL POSTE.': np.char.add('N', rng.integers(0, max(filas // 5, 1), size=filas).astype(str)),
+        'Latitud': latitud,
+        'Longitud': longitud,
+        'FechaCreacion': texto_fechas,
+        'Ubicacion': [f"https://maps.google.com/?q={a},{o}" for a, o in zip(lat, lon)],
+    })
+    # Una columna que la aplicación no usa, como en los libros reales
+    df['Observaciones'] = 'Instalación normal'
+    return df
+
+
+def guardar_libro(df, destino):
+    # openpyxl en modo escritura: escribe fila a fila sin construir la hoja en memoria
+    import openpyxl
+    
+    libro = openpyxl.Workbook(write_only=True)
+    hoja = libro.create_sheet()
+    hoja.append(list(df.columns))
+    for fila in df.itertuples(index=False, name=None):
+        hoja.append([v.item() if isinstance(v, np.generic) else v for v in fila])
+    libro.save(destino)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un libro sintético de instalaciones.")
+    parser.add_argument('filas', type=int)
+    parser.add_argument('destino', help="Archivo .xlsx, .csv o .parquet")
+    parser.add_argument('--tecnicos', type=int, default=20)
+    parser.add_argument('--duplicados', type=float, default=0.2, help="Fracción de coordenadas repetidas")
+    parser.add_argument('--comas', type=float, default=0.3, help="Fracción de coordenadas con coma decimal")
+    parser.add_argument('--am-pm', type=float, default=0.5, help="Fracción de fechas con a. m./p. m.")
+    parser.add_argument('--dias', type=int, default=30)
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    df = generar_instalaciones(args.filas, args.tecnicos, args.duplicados, args.comas,
+                               args.am_pm, args.dias, args.semilla)
+    if args.destino.endswith('.csv'):
+        df.to_csv(args.destino, index=False)
+    elif args.destino.endswith('.parquet'):
+        df.astype({'Latitud': str, 'Longitud': str}).to_parquet(args.destino, index=False)
+    else:
+        guardar_libro(df, args.destino)
+    print(f"{len(df)} filas en {args.destino}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import glob
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from ingesta import VERSION_PROCESO
+from utilities import RUTA_ALIAS_TECNICOS
+
+# Claves de dataset: sha256 en hexadecimal (ver almacen.calcular_clave). Llegan
+# del navegador, así que se validan antes de formar rutas con ellas
+FORMATO_CLAVE = re.compile(r'[0-9a-f]{64}')
+# Anexos seguidos que se guardan como tramos antes de reescribir el dataset
+MAX_ANEXOS = 30
+DIRECTORIO_CACHE = os.environ.get(
+    'MAPA_DIRECTORIO_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_datos')
+)
+
+
+def version_cache():
+    # La versión del proceso y la tabla de alias determinan el resultado
+    firma = hashlib.sha256(str(VERSION_PROCESO).encode())
+    if os.path.exists(RUTA_ALIAS_TECNICOS):
+        with open(RUTA_ALIAS_TECNICOS, 'rb') as archivo:
+            firma.update(archivo.read())
+    return f"v{VERSION_PROCESO}-{firma.hexdigest()[:8]}"
+
+
+def clave_valida(clave):
+    return isinstance(clave, str) and FORMATO_CLAVE.fullmatch(clave) is not None
+
+
+def _valor_json(valor):
+    if isinstance(valor, (np.integer, np.floating, np.bool_)):
+        valor = valor.item()
+    if isinstance(valor, float) and np.isnan(valor):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.isoformat()
+    return valor
+
+
+class CacheDisco:
+    """Datasets procesados en disco, una carpeta por archivo y versión del proceso.
+
+    Cada columna es un .npy que se abre con memory-mapping: solo las páginas
+    que lee un callback llegan a memoria. Las columnas de texto y categóricas
+    se guardan como códigos enteros con sus valores en un .json aparte, así
+    meta.json queda pequeño. Un dataset anexado guarda solo sus filas nuevas,
+    las categorías que agrega y la clave del dataset base.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_CACHE):
+        self.directorio = directorio
+
+    def ruta(self, clave):
+        if not clave_valida(clave):
+            raise ValueError(f"Clave de dataset inválida: {clave!r}")
+        return os.path.join(self.directorio, f"{clave}-{version_cache()}")
+
+    def existe(self, clave):
+        return os.path.exists(os.path.join(self.ruta(clave), 'meta.json'))
+
+    def eliminar(self, clave):
+        shutil.rmtree(self.ruta(clave), ignore_errors=True)
+
+    def guardar(self, clave, df, colores):
+        return self._escribir(clave, df, colores, {'anexos': 0})
+
+    def guardar_anexo(self, clave, clave_base, df, df_base, colores):
+        # Dataset anexado: solo se escriben las filas posteriores a df_base y
+        # la carga las une a las de clave_base. Cada MAX_ANEXOS se escribe
+        # completo para que la cadena de tramos no crezca sin límite.
+        base = self._leer_meta(clave_base)
+        if base is None or base.get('anexos', 0) + 1 > MAX_ANEXOS:
+            return self.guardar(clave, df, colores)
+        categorias_base = {c: df_base[c].cat.categories for c in df_base.columns
+                           if isinstance(df_base[c].dtype, pd.CategoricalDtype)}
+        return self._escribir(clave, df.iloc[len(df_base):], colores, {
+            'anexos': base.get('anexos', 0) + 1, 'base': clave_base, 'filas_base': len(df_base)
+        }, categorias_base)
+
+    def _escribir(self, clave, df, colores, extra, categorias_base=None):
+        destino = self.ruta(clave)
+        if os.path.exists(destino):
+            return destino
+        os.makedirs(self.directorio, exist_ok=True)
+        self._limpiar_temporales()
+        temporal = tempfile.mkdtemp(prefix='.tmp-', dir=self.directorio)
+        try:
+            columnas = []
+            for i, columna in enumerate(df.columns):
+                serie = df[columna]
+                archivo = f"{i}.npy"
+                info = {'nombre': columna, 'archivo': archivo}
+                if isinstance(serie.dtype, pd.CategoricalDtype):
+                    info['tipo'] = 'categoria'
+                    valores = serie.cat.categories
+                    previas = (categorias_base or {}).get(columna)
+                    if previas is not None and valores[:len(previas)].equals(previas):
+                        # Continúa las categorías del tramo base: solo se guardan las agregadas
+                        info['anexa'] = True
+                        valores = valores[len(previas):]
+                    self._escribir_valores(temporal, info, i, valores)
+                    datos = serie.cat.codes.to_numpy()
+                elif pd.api.types.is_datetime64_any_dtype(serie):
+                    info['tipo'] = 'fecha'
+                    info['dtype'] = str(serie.dtype)
+                    datos = serie.to_numpy().view('int64')
+                elif serie.dtype == object:
+                    info['tipo'] = 'texto'
+                    codigos, unicos = pd.factorize(serie)
+                    self._escribir_valores(temporal, info, i, unicos)
+                    datos = codigos.astype(np.int32)
+                else:
+                    info['tipo'] = 'numero'
+                    datos = serie.to_numpy()
+                np.save(os.path.join(temporal, archivo), datos, allow_pickle=False)
+                columnas.append(info)
+            
+            meta = {'clave': clave, 'version': version_cache(), 'filas': len(df),
+                    'columnas': columnas, 'colores': colores, **extra}
+            with open(os.path.join(temporal, 'meta.json'), 'w', encoding='utf-8') as archivo:
+                json.dump(meta, archivo, ensure_ascii=False)
+            # El rename hace visible el dataset completo o nada
+            os.replace(temporal, destino)
+        except FileExistsError:
+            shutil.rmtree(temporal, ignore_errors=True)
+        except OSError:
+            shutil.rmtree(temporal, ignore_errors=True)
+            if not os.path.exists(destino):
+                raise
+        return destino
+
+    def _escribir_valores(self, temporal, info, i, valores):
+        info['valores'] = f"{i}.json"
+        with open(os.path.join(temporal, info['valores']), 'w', encoding='utf-8') as archivo:
+            json.dump([_valor_json(v) for v in valores], archivo, ensure_ascii=False)
+
+    def _limpiar_temporales(self, antiguedad_s=3600):
+        # Escrituras interrumpidas (carga cancelada o proceso terminado)
+        limite = time.time() - antiguedad_s
+        for ruta in glob.glob(os.path.join(self.directorio, '.tmp-*')):
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    shutil.rmtree(ruta, ignore_errors=True)
+            except OSError:
+                pass
+
+    def guardar_derivado(self, clave, nombre, objeto):
+        # Estructuras derivadas (índices) para que otro proceso no las reconstruya
+        ruta = self.ruta(clave)
+        if not os.path.isdir(ruta):
+            return
+        destino = os.path.join(ruta, f"derivado-{nombre}.pkl")
+        temporal = f"{destino}.{os.getpid()}.tmp"
+        with open(temporal, 'wb') as archivo:
+            pickle.dump(objeto, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, destino)
+
+    def cargar_derivados(self, clave):
+        derivados = {}
+        for ruta in glob.glob(os.path.join(self.ruta(clave), 'derivado-*.pkl')):
+            nombre = os.path.basename(ruta)[len('derivado-'):-len('.pkl')]
+            try:
+                with open(ruta, 'rb') as archivo:
+                    derivados[nombre] = pickle.load(archivo)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                continue  # Se reconstruye al usarlo
+        return derivados
+
+    def _leer_meta(self, clave):
+        try:
+            with open(os.path.join(self.ruta(clave), 'meta.json'), encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except FileNotFoundError:
+            return None
+
+    def _valores(self, ruta, info):
+        with open(os.path.join(ruta, info['valores']), encoding='utf-8') as archivo:
+            return json.load(archivo)
+
+    def _arreglo(self, ruta, info):
+        return np.load(os.path.join(ruta, info['archivo']), mmap_mode='r', allow_pickle=False)
+
+    def _columna(self, ruta, info):
+        arreglo = self._arreglo(ruta, info)
+        if info['tipo'] == 'fecha':
+            return arreglo.view(info['dtype'])
+        if info['tipo'] == 'texto':
+            # Columnas casi sin repetidos: un arreglo de objetos sobre los
+            # valores ocupa menos que una categórica con su tabla hash
+            valores = np.array(self._valores(ruta, info) + [None], dtype=object)
+            return valores[arreglo]
+        return arreglo
+
+    def _categorica(self, columnas):
+        # Los códigos de cada tramo son respecto a sus categorías; las de un
+        # tramo 'anexa' continúan las del anterior. Solo se traducen los
+        # códigos de los tramos cuyas categorías no son un prefijo de las finales
+        partes = []
+        categorias = None
+        for ruta, info in columnas:
+            valores = pd.Index(self._valores(ruta, info))
+            if info['tipo'] == 'categoria':
+                categorias = categorias.append(valores) if info.get('anexa') else valores
+                valores = categorias
+            partes.append((self._arreglo(ruta, info), valores))
+        final = partes[-1][1]
+        codigos = [arreglo if valores is final or final[:len(valores)].equals(valores)
+                   else np.append(final.get_indexer(valores), -1)[arreglo]
+                   for arreglo, valores in partes]
+        codigos = codigos[0] if len(codigos) == 1 else np.concatenate(codigos)
+        return pd.Categorical.from_codes(codigos, categories=final)
+
+    def cargar(self, clave):
+        # Un dataset anexado se arma con los tramos de su cadena de bases; si
+        # falta alguno no se puede recuperar
+        tramos = []
+        while clave is not None:
+            meta = self._leer_meta(clave)
+            if meta is None:
+                return None
+            tramos.append((self.ruta(clave), meta))
+            clave = meta.get('base')
+        tramos.reverse()
+        
+        meta = tramos[-1][1]
+        datos = {}
+        for info in meta['columnas']:
+            columnas = [(ruta, next(c for c in m['columnas'] if c['nombre'] == info['nombre']))
+                        for ruta, m in tramos]
+            if info['tipo'] == 'categoria':
+                datos[info['nombre']] = self._categorica(columnas)
+                continue
+            partes = [self._columna(ruta, c) for ruta, c in columnas]
+            datos[info['nombre']] = partes[0] if len(partes) == 1 else np.concatenate(partes)
+        df = pd.DataFrame(datos, copy=False)
+        return df, meta['colores']
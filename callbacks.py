@@ -1,85 +1,263 @@
 import base64
+import logging
 import numpy as np
 import io
 import dash
-from dash import html, Input, Output, State
-import pandas as pd
-import unicodedata
+from dash import ClientsideFunction, Input, Output, Patch, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
-import random
-from datetime import datetime
-from utilities import convertir_fechas, parse_coord
+import dash_bootstrap_components as dbc
+from ingesta import ErrorIngesta, procesar_archivo
+from almacen import almacen, calcular_clave
+from indice import obtener_indice
+from figuras import traza_densidad, traza_grupos, traza_puntos, trazas_optimizadas, trazas_rutas
+from metricas_rutas import obtener_metricas
+from optimizacion_rutas import analizar
+from niveles import (UMBRAL_PUNTOS, ZOOM_DETALLE, en_vista, leer_vista, obtener_rejilla,
+                     tramos_en_vista)
+from densidad import celdas_densidad
+from incremental import anexar, combinar_clave, obtener_estado
+from exportacion import orden_rutas, registrar_exportacion
+from espacial import bits_zona, describir_zona, leer_seleccion, obtener_espacial
+from reproduccion import MAX_PUNTOS, preparar_reproduccion
+from instrumentacion import (PANEL_DEPURACION, AppInstrumentada, registrar_filas,
+                             registro, resumen_callbacks)
 
-def eliminar_tildes(texto):
+logger = logging.getLogger(__name__)
+
+def mensaje_carga(filename, resumen):
+    if resumen is None:
+        return dbc.Alert(f"{filename}: archivo ya procesado", color="info")
+    antes, despues = resumen['memoria'].loc['Total'] / 2**20
+    return dbc.Alert(
+        f"{filename}: {resumen['filas_validas']} de {resumen['filas_leidas']} filas válidas "
+        f"({resumen['filas_descartadas']} descartadas), {resumen['tecnicos']} técnicos, "
+        f"{despues:.1f} MB en memoria ({antes:.1f} MB sin compactar)",
+        color="success"
+    )
+
+def mensaje_anexado(filename, resumen):
+    return dbc.Alert(
+        f"{filename}: {resumen['filas_nuevas']} filas anexadas "
+        f"({resumen['duplicadas']} duplicadas por OT y fecha descartadas), "
+        f"{resumen['filas_totales']} filas en total",
+        color="success"
+    )
+
+# Etapas de la carga: texto y tramo de la barra de progreso que ocupan. Lectura,
+# normalización y fechas avanzan juntas, bloque a bloque.
+ETAPAS_CARGA = {
+    'lectura': ("Leyendo archivo", 0, 80),
+    'normalizacion': ("Normalizando técnicos y coordenadas", 0, 80),
+    'fechas': ("Interpretando fechas", 0, 80),
+    'ajuste': ("Separando puntos repetidos", 80, 90),
+    'indice': ("Construyendo índices", 90, 100),
+}
+DERIVADOS_PERSISTIDOS = ('indice', 'incremental', 'rejilla', 'metricas', 'espacial')
+
+def progreso_carga(set_progress):
+    def progreso(etapa, hechas, total):
+        texto, inicio, fin = ETAPAS_CARGA[etapa]
+        valor = inicio + (fin - inicio) * min(hechas / total, 1) if total else inicio
+        if hechas and etapa in ('lectura', 'normalizacion', 'fechas'):
+            texto += f" ({hechas:,} de {total:,} filas)" if total else f" ({hechas:,} filas)"
+        set_progress((int(valor), f"{int(valor)} %", texto))
+    return progreso
+
+def cargar_archivo(contents, filename, modo, data, progreso=None):
+    progreso = progreso or (lambda etapa, hechas, total: None)
+    if contents is None:
+        return dash.no_update, dash.no_update
+    
+    content_type, content_string = contents.split(',')
+    decoded = base64.b64decode(content_string)
+    clave = calcular_clave(decoded)
+    
+    base = almacen.obtener(data['clave']) if modo == 'anexar' and data else None
+    if base is not None:
+        clave = combinar_clave(base.clave, clave)
+    
+    # El mismo archivo (o la misma combinación) ya está procesado en el servidor
+    if clave in almacen:
+        return {'clave': clave}, mensaje_carga(filename, None)
+    
     try:
-        texto = unicodedata.normalize('NFKD', texto)
-        texto = texto.encode('ASCII', 'ignore').decode('ASCII')
-    except:
-        pass
-    return texto.upper()
+        df, colores, resumen = procesar_archivo(io.BytesIO(decoded), filename, progreso)
+        logger.info("%s: FechaCreacion por formato %s", filename, resumen['fechas_por_formato'])
+        logger.info("%s: bytes por columna\n%s", filename, resumen['memoria'].to_string())
+        
+        progreso('indice', 0, 1)
+        if base is None:
+            conjunto = almacen.guardar(clave, df, colores)
+            obtener_indice(conjunto)
+            obtener_estado(conjunto)
+            mensaje = mensaje_carga(filename, resumen)
+        else:
+            # Las estructuras derivadas se extienden con las filas nuevas y
+            # en disco solo se escriben esas filas
+            df, colores, derivados, resumen = anexar(base, df)
+            conjunto = almacen.guardar(clave, df, colores, base=base)
+            conjunto.agregar_derivados(derivados)
+            mensaje = mensaje_anexado(filename, resumen)
+        obtener_rejilla(conjunto)
+        obtener_espacial(conjunto)
+        obtener_metricas(conjunto)
+        # La carga puede correr en otro proceso: los índices quedan en disco
+        # para que el worker que atienda el mapa no los reconstruya
+        almacen.persistir_derivados(conjunto, DERIVADOS_PERSISTIDOS)
+        progreso('indice', 1, 1)
+        return {'clave': clave}, mensaje
+    
+    except ErrorIngesta as e:
+        # Problema del archivo (formato, columnas): se informa tal cual
+        return dash.no_update, dbc.Alert(f"No se pudo procesar {filename}: {e}", color="warning")
+    except Exception as e:
+        logger.exception("Error procesando %s", filename)
+        return dash.no_update, dbc.Alert(
+            f"Error inesperado procesando {filename} ({type(e).__name__}: {e}). "
+            "El detalle quedó en el registro del servidor.",
+            color="danger"
+        )
+
+def figura_mapa(datos, lat_center, lon_center, zoom_level, n_clicks, data):
+    fig1 = go.Figure()
+    
+    # Configurar layout. uirevision conserva el zoom y el desplazamiento del
+    # usuario mientras no se vuelva a pulsar el botón de filtrar.
+    fig1.update_layout(
+        mapbox_style="open-street-map",
+        margin={"r":70,"t":0,"l":0,"b":40},
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        ),
+        mapbox=dict(
+            center=dict(lat=lat_center, lon=lon_center),
+            zoom=zoom_level
+        ),
+        uirevision=f"{data['clave']}-{n_clicks}"
+    )
+    
+    return {'data': datos, 'layout': fig1.layout}
+
+def vista_inicial(df, posiciones):
+    # Vista tras filtrar sin puntos visibles: centro en un punto al azar, zoom 12
+    punto = np.random.choice(posiciones)
+    return {'zoom': 12, 'lat': df['Latitud'].iat[punto], 'lon': df['Longitud'].iat[punto]}
+
+def ordenar_por_tecnico(df, posiciones):
+    # Orden de recorrido y número de secuencia de cada punto por técnico,
+    # el mismo que usa la exportación
+    posiciones, secuencia, _, _ = orden_rutas(df, posiciones)
+    return df.take(posiciones).assign(Secuencia=secuencia)
+
+def rutas_en_vista(conjunto, orden, tipo_ruta, vista):
+    # Rutas del zoom de detalle sobre el orden de todo lo filtrado: solo los
+    # tramos que tocan la vista, con un corte donde se salta uno que no
+    if tipo_ruta not in ('individuales', 'todas', 'unificadas') or len(orden) < 2:
+        return []
+    rejilla = obtener_rejilla(conjunto)
+    lat, lon = rejilla.lat[orden], rejilla.lon[orden]
+    codigos = conjunto.df['Tecnico_Clean'].cat.codes.to_numpy()[orden]
+    dibujados = (codigos[1:] == codigos[:-1]) & tramos_en_vista(
+        lat[:-1], lon[:-1], lat[1:], lon[1:], vista
+    )
+    filas = np.flatnonzero(np.r_[dibujados, False] | np.r_[False, dibujados])
+    continua = (np.diff(filas) == 1) & dibujados[filas[:-1]]
+    tramos = np.cumsum(np.r_[0, ~continua])
+    return trazas_rutas(conjunto.df.take(orden[filas]), conjunto.colores,
+                        unificadas=tipo_ruta == 'unificadas', tramos=tramos)
 
-def registrar_callbacks(app):
+def rutas_optimizadas(conjunto, posiciones, tipo_ruta):
+    # Con grupos o en el zoom de detalle solo se reducen los marcadores: las
+    # rutas optimizadas salen del análisis de todos los técnico-días filtrados
+    if tipo_ruta != 'optimizadas':
+        return []
+    return trazas_ruta(conjunto, ordenar_por_tecnico(conjunto.df, posiciones), tipo_ruta)
+
+def puntos_con_saltos(conjunto, filtered_df):
+    # Traza de puntos; el hover avisa de los saltos imposibles. filtered_df
+    # conserva como índice la posición de cada fila en conjunto.df
+    saltos = obtener_metricas(conjunto).velocidad_salto[filtered_df.index.to_numpy()]
+    return traza_puntos(filtered_df, conjunto.colores, saltos)
+
+def trazas_ruta(conjunto, filtered_df, tipo_ruta):
+    if tipo_ruta in ['individuales', 'todas']:
+        return trazas_rutas(filtered_df, conjunto.colores)
+    if tipo_ruta == 'unificadas':
+        return trazas_rutas(filtered_df, conjunto.colores, unificadas=True)
+    if tipo_ruta == 'optimizadas':
+        return trazas_optimizadas(filtered_df, *analizar(conjunto, filtered_df))
+    return []
+
+# Actualizaciones parciales de la figura: el navegador aplica los cambios
+# sobre la figura que ya tiene en lugar de recibirla entera
+
+def parche_trazas(datos):
+    parche = Patch()
+    parche['data'] = datos
+    return parche
+
+def parche_rutas(trazas_previas, rutas):
+    # La traza 0 son los puntos; las demás son rutas y se reemplazan
+    parche = Patch()
+    for _ in range(trazas_previas - 1):
+        del parche['data'][1]
+    parche['data'].extend(rutas)
+    return parche
+
+def parche_agregar(puntos, rutas):
+    # Patch.extend solo acepta listas
+    parche = Patch()
+    for campo in ('lat', 'lon', 'text', 'customdata', 'hovertext'):
+        parche['data'][0][campo].extend(puntos[campo].tolist())
+    parche['data'][0]['marker']['color'].extend(puntos['marker']['color'].tolist())
+    parche['data'].extend(rutas)
+    return parche
+
+def registrar_callbacks(app, gestor=None):
+    # Todos los callbacks registrados con app.callback quedan medidos
+    app = AppInstrumentada(app)
+    
+    # Carga en segundo plano si hay gestor de tareas (ver tareas.py); si no,
+    # el mismo proceso corre dentro de la petición
+    if gestor is not None:
+        opciones_carga = dict(
+            background=True,
+            manager=gestor,
+            progress=[Output('progreso-carga', 'value'),
+                      Output('progreso-carga', 'label'),
+                      Output('etapa-carga', 'children')],
+            cancel=[Input('cancelar-carga', 'n_clicks')],
+            running=[(Output('cancelar-carga', 'disabled'), False, True),
+                     (Output('panel-progreso', 'style'), {'display': 'block'}, {'display': 'none'}),
+                     (Output('upload-data', 'disabled'), True, False)],
+        )
+    else:
+        opciones_carga = {}
+    
     @app.callback(
     Output('stored-data', 'data'),
+    Output('estado-carga', 'children'),
     Input('upload-data', 'contents'),
     State('upload-data', 'filename'),
-    prevent_initial_call=True
+    State('modo-carga', 'value'),
+    State('stored-data', 'data'),
+    prevent_initial_call=True,
+    **opciones_carga
     )
-    def process_uploaded_file(contents, filename):
-        if contents is None:
-            return dash.no_update
-        
-        content_type, content_string = contents.split(',')
-        decoded = base64.b64decode(content_string)
-        
-        try:
-            df = pd.read_excel(io.BytesIO(decoded))
-            
-            # Procesamiento de datos
-            df['Tecnico_Clean'] = (
-            df['4.Nombre del Técnico Instalador']
-            .astype(str)
-            .apply(eliminar_tildes)
-            .str.upper()
-            .str.strip()  # Elimina espacios al inicio/final
-            .str.replace(r'\s+', ' ', regex=True)  # Unifica múltiples espacios
-            .str.replace(r'[^A-Z ]', '', regex=True)  # Elimina caracteres especiales
-            )
-            df['Latitud_adj'] = df['Latitud']
-            df['Longitud_adj'] = df['Longitud']
-            
-            # Ajuste de coordenadas
-            groups = df.groupby(['Latitud', 'Longitud'])
-            for (lat, lon), group in groups:
-                if len(group) > 1:
-                    indices = group.index
-                    for i, idx in enumerate(indices[1:]):
-                        angle = np.random.uniform(0, 2 * np.pi)
-                        delta_lat = (5 / 111320) * np.cos(angle)
-                        delta_lon = (5 / (111320 * np.cos(np.radians(lat)))) * np.sin(angle)
-                        df.at[idx, 'Latitud_adj'] = lat + delta_lat
-                        df.at[idx, 'Longitud_adj'] = lon + delta_lon
-            
-            df["Latitud"] = df["Latitud"].apply(parse_coord)
-            df["Longitud"] = df["Longitud"].apply(parse_coord)
-            df = df.dropna(subset=["Latitud", "Longitud"])
-            df = df[(df["Latitud"] > 0) & (df["Longitud"] < 0)]
-            
-            df['FechaCreacion'] = df['FechaCreacion'].apply(convertir_fechas)
-            
-            # Generar colores
-            tecnicos = sorted(df['Tecnico_Clean'].dropna().unique())
-            colores = {t: f"rgb({random.randint(0,255)},{random.randint(0,255)},{random.randint(0,255)})" 
-                      for t in tecnicos}
-            
-            return {
-                'df': df.to_json(date_format='iso', orient='split'),
-                'colores': colores
-            }
-            
-        except Exception as e:
-            print(e)
-            return dash.no_update
+    def process_uploaded_file(*args):
+        if opciones_carga:
+            set_progress, contents, filename, modo, data = args
+            progreso = progreso_carga(set_progress)
+        else:
+            contents, filename, modo, data = args
+            progreso = None
+        return cargar_archivo(contents, filename, modo, data, progreso)
     
  
     # Callback para actualizar dropdown de técnicos
@@ -88,82 +266,75 @@ def registrar_callbacks(app):
         Input('stored-data', 'data')
     )
     def update_tecnicos(data):
-        if not data:
+        conjunto = almacen.obtener(data['clave']) if data else None
+        if conjunto is None:
             return []
-        df = pd.read_json(data['df'], orient='split')
-        tecnicos = sorted([t for t in df['Tecnico_Clean'].unique() if t is not None])
+        df = conjunto.df
+        tecnicos = list(df['Tecnico_Clean'].cat.categories)
         return [{'label': t, 'value': t} for t in tecnicos]
     
+    # Zona del mapa: selección con caja o lazo, o radio alrededor del punto pulsado
+    @app.callback(
+        Output('filtro-zona', 'data'),
+        Output('descripcion-zona', 'children'),
+        Input('mapa', 'selectedData'),
+        Input('boton-zona-radio', 'n_clicks'),
+        Input('boton-quitar-zona', 'n_clicks'),
+        State('mapa', 'clickData'),
+        State('radio-zona', 'value'),
+        prevent_initial_call=True
+    )
+    def definir_zona(seleccion, n_radio, n_quitar, click, metros):
+        disparador = dash.ctx.triggered_id
+        if disparador == 'boton-quitar-zona':
+            zona = None
+        elif disparador == 'boton-zona-radio':
+            if not click or not click['points'] or not metros:
+                raise PreventUpdate
+            punto = click['points'][0]
+            zona = {'tipo': 'radio', 'lat': punto['lat'], 'lon': punto['lon'], 'metros': float(metros)}
+        else:
+            zona = leer_seleccion(seleccion)
+            if zona is None:
+                raise PreventUpdate
+        return zona, describir_zona(zona)
+    
     @app.callback(
         Output('filtro-fecha', 'options'),
         Output('filtro-fecha', 'value'),
-        Input('boton-filtrar', 'n_clicks'),
+        Output('horas-por-fecha', 'data'),
+        [Input('boton-filtrar', 'n_clicks'),
+         Input('filtro-zona', 'data')],
         [State('filtro-tecnico', 'value'),
          State('filtro-ot', 'value'),
          State('filtro-nodo', 'value'),
          State('stored-data', 'data')]  # <-- Añadir este State
     )
-    def actualizar_fechas_disponibles(n_clicks, tecnicos_sel, ot, nodo, data):
-        if not data:
-            return [], None
-        df = pd.read_json(data['df'], orient='split')
-        df['FechaCreacion'] = pd.to_datetime(df['FechaCreacion'])
-        filtered_df = df.copy()
+    def actualizar_fechas_disponibles(n_clicks, zona, tecnicos_sel, ot, nodo, data):
+        conjunto = almacen.obtener(data['clave']) if data else None
+        if conjunto is None:
+            return [], None, {}
+        indice = obtener_indice(conjunto)
         
-        # Aplicar filtros básicos
-        if tecnicos_sel:
-            filtered_df = filtered_df[filtered_df['Tecnico_Clean'].isin(tecnicos_sel)]
-        if ot:
-            filtered_df = filtered_df[filtered_df['2.Nro de O.T.'].astype(str).str.contains(ot)]
-        if nodo:
-            filtered_df = filtered_df[filtered_df['1.NODO DEL POSTE.'].astype(str).str.contains(nodo)]
+        # Fechas únicas y ordenadas de las filas que cumplen los filtros básicos
+        posiciones = indice.posiciones(tecnicos=tecnicos_sel, ot=ot, nodo=nodo,
+                                       area=bits_zona(conjunto, zona))
+        registrar_filas(len(conjunto.df), len(posiciones))
+        fechas_disponibles = indice.fechas(posiciones)
         
-        # Extraer fechas únicas y ordenadas
-        if not filtered_df.empty:
-            filtered_df['Fecha'] = filtered_df['FechaCreacion'].dt.strftime('%d/%m/%Y')
-            fechas_disponibles = sorted(filtered_df['Fecha'].unique().tolist())
-        else:
-            fechas_disponibles = []
-        
-        return [{'label': f, 'value': f} for f in fechas_disponibles], None
-    # Callback para actualizar horas disponibles
-    @app.callback(
+        # Las horas de cada fecha viajan con las fechas: elegir una fecha no
+        # vuelve a consultar el servidor
+        horas = indice.horas_por_fecha(posiciones)
+        return [{'label': f, 'value': f} for f in fechas_disponibles], None, horas
+    # Horas disponibles de la fecha elegida, a partir de horas-por-fecha
+    app.clientside_callback(
+        ClientsideFunction(namespace='mapa', function_name='horas_disponibles'),
         Output('filtro-hora', 'options'),
         Output('filtro-hora', 'value'),
         Output('filtro-hora', 'disabled'),
         Input('filtro-fecha', 'value'),
-        [State('filtro-tecnico', 'value'),
-         State('filtro-ot', 'value'),
-         State('filtro-nodo', 'value'),
-         State('stored-data', 'data')]
+        State('horas-por-fecha', 'data')
     )
-    def actualizar_horas_disponibles(fecha_seleccionada, tecnicos_sel, ot, nodo, data):
-        if not data:
-            return [], None, True  # <-- Añadir el tercer elemento (disabled=True)
-        
-        df = pd.read_json(data['df'], orient='split')
-        df['FechaCreacion'] = pd.to_datetime(df['FechaCreacion'], errors='coerce')
-        if not fecha_seleccionada:
-            return [], None, True  # Deshabilitar si no hay fecha
-        
-        filtered_df = df.copy()
-        
-        # Aplicar filtros básicos
-        if tecnicos_sel:
-            filtered_df = filtered_df[filtered_df['Tecnico_Clean'].isin(tecnicos_sel)]
-        if ot:
-            filtered_df = filtered_df[filtered_df['2.Nro de O.T.'].astype(str).str.contains(ot)]
-        if nodo:
-            filtered_df = filtered_df[filtered_df['1.NODO DEL POSTE.'].astype(str).str.contains(nodo)]
-        
-        # Filtrar por fecha seleccionada
-        filtered_df = filtered_df[
-            filtered_df['FechaCreacion'].dt.strftime('%d/%m/%Y') == fecha_seleccionada
-        ]
-        
-        # Extraer horas únicas
-        horas_disponibles = sorted(filtered_df['FechaCreacion'].dt.strftime('%H:%M').unique())
-        return [{'label': h, 'value': h} for h in horas_disponibles], None, False
     
     @app.callback(
         Output('filtro-fecha-sincro', 'start_date'),
@@ -171,72 +342,126 @@ def registrar_callbacks(app):
         Input('stored-data', 'data')
     )
     def update_datepicker(data):
-        if not data:
+        conjunto = almacen.obtener(data['clave']) if data else None
+        if conjunto is None:
             return dash.no_update, dash.no_update
-        df = pd.read_json(data['df'], orient='split')
-        # Convertir la columna a datetime en caso de que no lo sea
-        df['FechaCreacion'] = pd.to_datetime(df['FechaCreacion'], errors='coerce')
-        min_date = df['FechaCreacion'].min()
-        max_date = df['FechaCreacion'].max()
+        estado = obtener_estado(conjunto)
+        min_date = estado.fecha_min
+        max_date = estado.fecha_max
         # DatePickerRange espera fechas en formato ISO (YYYY-MM-DD)
         return min_date.date().isoformat(), max_date.date().isoformat()
         
     @app.callback(
         Output('mapa', 'figure'),
+        Output('estado-mapa', 'data'),
         [Input('boton-filtrar', 'n_clicks'),
-         Input('tipo-ruta', 'value')],
+         Input('tipo-ruta', 'value'),
+         Input('mapa', 'relayoutData'),
+         Input('filtro-zona', 'data')],
         [State('filtro-tecnico', 'value'),
          State('filtro-ot', 'value'),
          State('filtro-nodo', 'value'),
          State('filtro-fecha', 'value'),
          State('filtro-hora', 'value'),
-         State('stored-data', 'data')]  # <-- Añadir este State
+         State('stored-data', 'data'),
+         State('estado-mapa', 'data')]
     )
-    def actualizar_mapa(n_clicks, tipo_ruta, tecnicos, ot, nodo, fecha, hora, data):
+    def actualizar_mapa(n_clicks, tipo_ruta, relayout, zona, tecnicos, ot, nodo, fecha, hora, data, previo):
         
-        if not data:
-            return go.Figure()
+        conjunto = almacen.obtener(data['clave']) if data else None
+        if conjunto is None:
+            return go.Figure(), None
         
-        # Leer el DataFrame y convertir la columna 'FechaCreacion' a datetime
-        df = pd.read_json(data['df'], orient='split')
-        df['FechaCreacion'] = pd.to_datetime(df['FechaCreacion'], errors='coerce')
+        # Un cambio de vista (zoom o desplazamiento) solo importa en modo agrupado.
+        # Al filtrar el mapa se recentra, así que la vista anterior no cuenta.
+        disparador = dash.ctx.triggered_id
+        por_vista = disparador == 'mapa'
+        vista = leer_vista(relayout) if disparador in ('mapa', 'tipo-ruta') else None
+        if por_vista and (vista is None or (previo or {}).get('modo') == 'reproduccion'):
+            return dash.no_update, dash.no_update
         
-        colores = data['colores']
-        filtered_df = df.copy()
+        df = conjunto.df
+        colores = conjunto.colores
+        indice = obtener_indice(conjunto)
         
-        # Aplicar filtros
-        if tecnicos:
-            filtered_df = filtered_df[filtered_df['Tecnico_Clean'].isin(tecnicos)]
-        if ot:
-            filtered_df = filtered_df[filtered_df['2.Nro de O.T.'].astype(str).str.contains(ot)]
-        if nodo:
-            filtered_df = filtered_df[filtered_df['1.NODO DEL POSTE.'].astype(str).str.contains(nodo)]
+        # Aplicar filtros (la hora se compara por cubeta hora:minuto)
+        area = bits_zona(conjunto, zona)
+        posiciones = indice.posiciones(
+            tecnicos=tecnicos, ot=ot, nodo=nodo, fecha=fecha, hora=hora, area=area
+        )
+        registrar_filas(len(df), len(posiciones))
+        densidad = tipo_ruta == 'densidad' and len(posiciones) > 0
+        agrupado = len(posiciones) > UMBRAL_PUNTOS
+        if por_vista and not agrupado and not densidad:
+            return dash.no_update, dash.no_update
         
-        # Filtro por fecha (independiente de la hora)
-        if fecha:
-            try:
-                fecha_dt = pd.to_datetime(fecha, format='%d/%m/%Y')
-                filtered_df = filtered_df[
-                    filtered_df['FechaCreacion'].dt.date == fecha_dt.date()
-                ]
-                
-                # Filtro adicional por hora si está seleccionada
-                if hora:
-                    hora_dt = datetime.strptime(hora, "%H:%M").time()
-                    filtered_df = filtered_df[
-                        filtered_df['FechaCreacion'].dt.time == hora_dt
-                    ]
-            except:
-                print("Error en formato de fecha/hora")
+        # Lo que queda dibujado en el mapa, para enviar después solo lo que cambie
+        estado = {
+            'clave': data['clave'], 'filtros': [ot, nodo, fecha, hora, zona],
+            'tecnicos': sorted(tecnicos) if tecnicos else None,
+            'tipo_ruta': tipo_ruta, 'modo': 'puntos', 'trazas': 1
+        }
         
-        # Ordenar y asignar secuencia
-        filtered_df = filtered_df.sort_values(
-            ['Tecnico_Clean', 'FechaCreacion'], 
-            ascending=[True, True]  # Orden ascendente
+        if densidad:
+            # Solo las celdas visibles con su conteo, al nivel que pide el zoom
+            if vista is None:
+                vista = vista_inicial(df, posiciones)
+            datos = [traza_densidad(*celdas_densidad(conjunto, posiciones, vista))]
+            estado['modo'] = 'densidad'
+            if por_vista:
+                return parche_trazas(datos), estado
+            return figura_mapa(datos, vista['lat'], vista['lon'], vista['zoom'], n_clicks, data), estado
+        
+        if agrupado:
+            rejilla = obtener_rejilla(conjunto)
+            if vista is None:
+                vista = vista_inicial(df, posiciones)
+            if vista['zoom'] < ZOOM_DETALLE:
+                limites = vista if 'lat_min' in vista else None
+                datos = [traza_grupos(*rejilla.grupos(vista['zoom'], posiciones, limites))]
+                datos += rutas_optimizadas(conjunto, posiciones, tipo_ruta)
+                estado['modo'] = 'grupos'
+                if por_vista:
+                    # El navegador ya tiene el layout con la vista del usuario
+                    return parche_trazas(datos), estado
+                return figura_mapa(datos, vista['lat'], vista['lon'], vista['zoom'], n_clicks, data), estado
+            # Zoom de detalle: secuencia y rutas salen de todo lo filtrado;
+            # solo los marcadores se recortan a los límites visibles
+            orden, secuencia, _, _ = orden_rutas(df, posiciones)
+            visibles = en_vista(rejilla.lat[orden], rejilla.lon[orden], vista)
+            puntos = df.take(orden[visibles]).assign(Secuencia=secuencia[visibles])
+            datos = [puntos_con_saltos(conjunto, puntos)] + rutas_en_vista(conjunto, orden, tipo_ruta, vista)
+            datos += rutas_optimizadas(conjunto, posiciones, tipo_ruta)
+            estado['modo'] = 'detalle'
+            estado['trazas'] = len(datos)
+            if por_vista:
+                return parche_trazas(datos), estado
+            return figura_mapa(datos, vista['lat'], vista['lon'], vista['zoom'], n_clicks, data), estado
+        
+        # Mismos puntos que ya están en el mapa: solo cambian las rutas
+        mismos_puntos = (
+            previo is not None and estado['modo'] == 'puntos' == previo.get('modo')
+            and all(previo.get(k) == estado[k] for k in ('clave', 'filtros'))
         )
+        if mismos_puntos and disparador == 'tipo-ruta' and previo['tecnicos'] == estado['tecnicos']:
+            rutas = trazas_ruta(conjunto, ordenar_por_tecnico(df, posiciones), tipo_ruta)
+            estado['trazas'] = 1 + len(rutas)
+            return parche_rutas(previo['trazas'], rutas), estado
+        
+        # Técnicos agregados a la selección: se envían solo sus puntos y rutas
+        if (mismos_puntos and disparador == 'boton-filtrar'
+                and previo['tipo_ruta'] == tipo_ruta == 'individuales'
+                and previo['tecnicos'] and estado['tecnicos']
+                and set(previo['tecnicos']) < set(estado['tecnicos'])):
+            agregados = sorted(set(estado['tecnicos']) - set(previo['tecnicos']))
+            nuevos_df = ordenar_por_tecnico(df, indice.posiciones(
+                tecnicos=agregados, ot=ot, nodo=nodo, fecha=fecha, hora=hora, area=area
+            ))
+            rutas = trazas_rutas(nuevos_df, colores)
+            estado['trazas'] = previo['trazas'] + len(rutas)
+            return parche_agregar(puntos_con_saltos(conjunto, nuevos_df), rutas), estado
         
-        # Asignar secuencia numérica por técnico
-        filtered_df['Secuencia'] = filtered_df.groupby('Tecnico_Clean').cumcount() + 1
+        filtered_df = ordenar_por_tecnico(df, posiciones)
         
         # Ordenar y asignar secuencia
         if not filtered_df.empty:        
@@ -255,124 +480,134 @@ def registrar_callbacks(app):
             lon_center = -74.297333 if 'Longitud' in df.columns else 0
             zoom_level = 10
             
-        fig1 = go.Figure()
+        # Marcadores con hovertext y customdata en una sola traza
+        datos = [puntos_con_saltos(conjunto, filtered_df)]
         
-        # Agregar marcadores con hovertext y customdata
-        fig1.add_trace(go.Scattermapbox(
-            lat=filtered_df['Latitud_adj'],
-            lon=filtered_df['Longitud_adj'],
-            mode='markers+text',
-            marker=go.scattermapbox.Marker(
-                size=12,
-                # En el callback actualizar_mapa, modifica:
-                color=[colores.get(tecnico, "rgb(128,128,128)") for tecnico in filtered_df['Tecnico_Clean']]
-            ),
-            text=filtered_df['Secuencia'].astype(str),
-            textposition="top center",
-            textfont=dict(size=12, color="black"),
-            customdata=filtered_df[[
-                'Tecnico_Clean',            
-                '2.Nro de O.T.',
-                '1.NODO DEL POSTE.',            
-                'FechaCreacion',
-                'Latitud',
-                'Longitud',
-                'Ubicacion'  
-            ]],
-            hoverinfo='text',
-            hovertext=filtered_df.apply(lambda row: 
-                f"Técnico: {row['Tecnico_Clean']}<br>" +
-                f"OT: {row['2.Nro de O.T.']}<br>" +
-                f"Nodo: {row['1.NODO DEL POSTE.']}<br>" +
-                f"Fecha Creación: {row['FechaCreacion'].strftime('%d/%m/%Y %H:%M')}<br>" +
-                f"Latitud: {row['Latitud']:.5f}<br>" +  # <-- Nueva línea
-                f"Longitud: {row['Longitud']:.5f}",  # <-- Nueva línea
-                axis=1
-            ),
-            name='Puntos'
-        ))
+        # Rutas como líneas agrupadas por color, separadas por NaN
+        datos += trazas_ruta(conjunto, filtered_df, tipo_ruta)
+        estado['trazas'] = len(datos)
         
-        # Agregar rutas (código existente)
-        if tipo_ruta in ['individuales', 'todas']:
-            for tecnico, grupo in filtered_df.groupby('Tecnico_Clean'):
-                grupo = grupo.sort_values('FechaCreacion')
-                if len(grupo) >= 1:
-                    fig1.add_trace(go.Scattermapbox(
-                        lat=grupo['Latitud_adj'],
-                        lon=grupo['Longitud_adj'],
-                        mode='lines+markers+text',
-                        line=dict(width=2, color=colores[tecnico]),
-                        marker=dict(size=10),
-                        text=grupo['Secuencia'].astype(str), 
-                        textposition="top center",
-                        textfont=dict(size=12, color="black"),
-                        name=f'Ruta {tecnico}',
-                        customdata=grupo[[  # <-- Usar 'grupo' en lugar de 'filtered_df'
-                            'Tecnico_Clean',                    
-                            '2.Nro de O.T.',
-                            '1.NODO DEL POSTE.',                    
-                            'FechaCreacion',
-                            'Latitud',
-                            'Longitud',
-                            'Ubicacion'  
-                        ]],
-                        hoverinfo='text',
-                        hovertext=grupo.apply(lambda row:
-                            f"Técnico: {row['Tecnico_Clean']}<br>" +
-                            f"OT: {row['2.Nro de O.T.']}<br>" +
-                            f"Nodo: {row['1.NODO DEL POSTE.']}<br>" +
-                            f"Fecha Creación: {row['FechaCreacion'].strftime('%d/%m/%Y %H:%M')}<br>" +
-                            f"Latitud: {row['Latitud']:.5f}<br>" +  # <-- Nueva línea
-                            f"Longitud: {row['Longitud']:.5f}",  # <-- Nueva línea
-                            axis=1
-                        ),
-                ))
-        
-        # Configurar layout
-        fig1.update_layout(
-            mapbox_style="open-street-map",
-            margin={"r":70,"t":0,"l":0,"b":40},
-            showlegend=True,
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            ),
-            mapbox=dict(
-                center=dict(lat=lat_center, lon=lon_center),
-                zoom=zoom_level
-            )
+        if vista is not None:
+            lat_center, lon_center, zoom_level = vista['lat'], vista['lon'], vista['zoom']
+        return figura_mapa(datos, lat_center, lon_center, zoom_level, n_clicks, data), estado
+    
+    # Reproducción en el tiempo: el servidor calcula los fotogramas una vez y
+    # el navegador los recorre enviando al mapa solo los puntos nuevos
+    @app.callback(
+        Output('mapa', 'figure', allow_duplicate=True),
+        Output('estado-mapa', 'data', allow_duplicate=True),
+        Output('datos-reproduccion', 'data'),
+        Output('fotograma-mostrado', 'data', allow_duplicate=True),
+        Output('slider-reproduccion', 'max'),
+        Output('slider-reproduccion', 'marks'),
+        Output('slider-reproduccion', 'value', allow_duplicate=True),
+        Output('boton-reproducir', 'disabled'),
+        Output('boton-reproducir', 'children', allow_duplicate=True),
+        Output('intervalo-reproduccion', 'disabled', allow_duplicate=True),
+        Output('hora-reproduccion', 'children', allow_duplicate=True),
+        Input('boton-reproduccion', 'n_clicks'),
+        [State('filtro-tecnico', 'value'),
+         State('filtro-ot', 'value'),
+         State('filtro-nodo', 'value'),
+         State('filtro-fecha', 'value'),
+         State('filtro-zona', 'data'),
+         State('stored-data', 'data')],
+        prevent_initial_call=True
+    )
+    def iniciar_reproduccion(n_clicks, tecnicos, ot, nodo, fecha, zona, data):
+        conjunto = almacen.obtener(data['clave']) if data else None
+        if conjunto is None:
+            raise PreventUpdate
+        posiciones = obtener_indice(conjunto).posiciones(
+            tecnicos=tecnicos, ot=ot, nodo=nodo, fecha=fecha, area=bits_zona(conjunto, zona)
         )
+        registrar_filas(len(conjunto.df), len(posiciones))
+        sin_cambios = [dash.no_update] * 10
+        if len(posiciones) > MAX_PUNTOS:
+            return (*sin_cambios, f"{len(posiciones):,} puntos: filtre por fecha o técnicos "
+                                  f"(máximo {MAX_PUNTOS:,})")
+        preparado = preparar_reproduccion(conjunto.df, posiciones, conjunto.colores,
+                                          obtener_metricas(conjunto).velocidad_salto)
+        if preparado is None:
+            return (*sin_cambios, "Sin puntos con fecha para reproducir")
         
-        return fig1
+        trazas, datos, marcas = preparado
+        figura = figura_mapa(trazas, float(np.mean(datos['lat'])), float(np.mean(datos['lon'])),
+                             12, 'reproduccion', data)
+        estado = {'clave': data['clave'], 'modo': 'reproduccion'}
+        return (figura, estado, datos, None, len(datos['limites']) - 1, marcas, 0,
+                False, 'Reproducir', True, datos['etiquetas'][0])
+    
+    app.clientside_callback(
+        ClientsideFunction(namespace='mapa', function_name='reproducir'),
+        Output('slider-reproduccion', 'value', allow_duplicate=True),
+        Output('intervalo-reproduccion', 'disabled', allow_duplicate=True),
+        Output('boton-reproducir', 'children', allow_duplicate=True),
+        Input('intervalo-reproduccion', 'n_intervals'),
+        Input('boton-reproducir', 'n_clicks'),
+        State('slider-reproduccion', 'value'),
+        State('intervalo-reproduccion', 'disabled'),
+        State('datos-reproduccion', 'data'),
+        State('estado-mapa', 'data'),
+        prevent_initial_call=True
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='mapa', function_name='mostrar_fotograma'),
+        Output('mapa', 'extendData'),
+        Output('mapa', 'figure', allow_duplicate=True),
+        Output('fotograma-mostrado', 'data', allow_duplicate=True),
+        Output('hora-reproduccion', 'children', allow_duplicate=True),
+        Input('slider-reproduccion', 'value'),
+        Input('datos-reproduccion', 'data'),
+        State('fotograma-mostrado', 'data'),
+        State('estado-mapa', 'data'),
+        State('mapa', 'figure'),
+        prevent_initial_call=True
+    )
     
-    # Callback para mostrar detalles del punto
+    # Callback para la tabla de métricas por técnico y día
     @app.callback(
+        Output('tabla-metricas', 'data'),
+        [Input('boton-filtrar', 'n_clicks'),
+         Input('stored-data', 'data')],
+        [State('filtro-tecnico', 'value'),
+         State('filtro-fecha', 'value')]
+    )
+    def actualizar_tabla_metricas(n_clicks, data, tecnicos, fecha):
+        conjunto = almacen.obtener(data['clave']) if data else None
+        if conjunto is None:
+            return []
+        resumen = obtener_metricas(conjunto).resumen_filtrado(tecnicos, fecha)
+        return resumen.to_dict('records')
+    
+    # Enlace de exportación con los filtros actuales; el servidor transmite
+    # el archivo desde /exportar/<formato>
+    registrar_exportacion(app.server)
+    app.clientside_callback(
+        ClientsideFunction(namespace='mapa', function_name='enlace_exportar'),
+        Output('enlace-exportar', 'href'),
+        [Input('formato-exportar', 'value'),
+         Input('filtro-tecnico', 'value'),
+         Input('filtro-ot', 'value'),
+         Input('filtro-nodo', 'value'),
+         Input('filtro-fecha', 'value'),
+         Input('filtro-hora', 'value'),
+         Input('filtro-zona', 'data'),
+         Input('stored-data', 'data')]
+    )
+    
+    # Detalles del punto: customdata ya está en el navegador (assets/callbacks.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace='mapa', function_name='mostrar_detalles'),
         Output('detalle-punto', 'children'),
         Input('mapa', 'clickData')
     )
-    def mostrar_detalles(clickData):
-        if not clickData or 'customdata' not in clickData['points'][0]:
-            return "Seleccione un punto en el mapa para ver detalles"
-        
-        punto = clickData['points'][0]
-        fecha_sincro = pd.to_datetime(punto['customdata'][3])
-        ubicacion = punto['customdata'][6]  # Índice 6 = Ubicacion
-        
-        return html.Div([
-            html.H4("Detalles de la Instalación"),
-            html.P(f"Técnico: {punto['customdata'][0]}"),
-            html.P(f"OT: {punto['customdata'][1]}"),
-            html.P(f"Nodo: {punto['customdata'][2]}"),
-            html.P(f"Fecha Creación: {fecha_sincro.strftime('%d/%m/%Y %H:%M')}"),
-            html.P(f"Latitud: {punto['customdata'][4]:.5f}" f"    Longitud: {punto['customdata'][5]:.5f}"),  # Índice 4
-            #html.P(f"Longitud: {punto['customdata'][5]:.5f}"),  # Índice 5
-            html.P(html.A(
-                "Ver en Google Maps",
-                href=ubicacion,
-                target="_blank",
-                style={'color': 'blue', 'textDecoration': 'underline'}
-            )) if ubicacion else html.P("Ubicación no disponible")
-        ])
\ No newline at end of file
+    
+    if PANEL_DEPURACION:
+        # Se registra sin instrumentar para no medirse a sí mismo
+        @app.app.callback(
+            Output('tabla-depuracion', 'data'),
+            Input('intervalo-depuracion', 'n_intervals')
+        )
+        def actualizar_panel_depuracion(n_intervals):
+            return resumen_callbacks(registro.agregado()[0])
@@ -0,0 +1,27 @@
+import numpy as np
+
+from niveles import PIXELES_CELDA, limites_centro, obtener_rejilla
+
+# El mapa de calor usa los grupos de la rejilla de niveles, NIVELES_FINOS
+# niveles más finos que los grupos del mismo zoom: cada celda ocupa
+# PIXELES_CELDA / 2**NIVELES_FINOS píxeles en pantalla, así que el número de
+# celdas enviadas depende del tamaño de la vista y no de las filas.
+NIVELES_FINOS = 2
+
+
+def nivel_densidad(zoom):
+    return int(max(np.floor(zoom) + NIVELES_FINOS, 0))
+
+
+def radio_pixeles(nivel, zoom):
+    # Radio de suavizado: algo más que el lado de la celda en pantalla
+    return max(5, int(1.5 * PIXELES_CELDA * 2 ** (zoom - nivel)))
+
+
+def celdas_densidad(conjunto, posiciones, vista):
+    # Devuelve (lat, lon, conteo, radio) de las celdas visibles con instalaciones
+    if 'lat_min' not in vista:
+        vista = limites_centro(vista)
+    nivel = nivel_densidad(vista['zoom'])
+    lat, lon, conteo = obtener_rejilla(conjunto).grupos(nivel, posiciones, vista)
+    return lat, lon, conteo, radio_pixeles(nivel, vista['zoom'])
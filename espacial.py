@@ -0,0 +1,176 @@
+import copy
+
+import numpy as np
+
+from indice import _empaquetar
+from metricas_rutas import haversine_km
+from utilities import METROS_POR_GRADO
+
+# Lado de la celda de la rejilla espacial, en metros
+METROS_CELDA = 100
+
+
+class IndiceEspacial:
+    """Rejilla hash sobre coordenadas proyectadas, construida al cargar.
+
+    Las coordenadas se proyectan a metros con una equirectangular centrada
+    en el dataset (la zona de operación es pequeña) y cada fila cae en una
+    celda de METROS_CELDA de lado. Las filas se ordenan por celda con la
+    clave fila * ancho + columna, así que las celdas de una misma fila de la
+    rejilla son un tramo contiguo: una consulta recorre solo las filas de
+    celdas que toca y verifica la distancia exacta sobre los candidatos.
+    """
+
+    def __init__(self, df, metros_celda=METROS_CELDA):
+        self.filas = len(df)
+        self.metros_celda = metros_celda
+        lat = df['Latitud'].to_numpy(dtype=float)
+        lon = df['Longitud'].to_numpy(dtype=float)
+        validas = np.isfinite(lat) & np.isfinite(lon)
+        self.lat0 = float(np.mean(lat[validas])) if validas.any() else 0.0
+        self._coseno = np.cos(np.radians(self.lat0))
+        x, y = self.proyectar(lat, lon)
+        self.x_min = float(x[validas].min()) if validas.any() else 0.0
+        self.y_min = float(y[validas].min()) if validas.any() else 0.0
+        self.ancho = int((x[validas].max() - self.x_min) // metros_celda) + 1 if validas.any() else 1
+        self.orden, self.claves, self.x, self.y = self._ordenar(x, y, validas)
+
+    def _ordenar(self, x, y, validas):
+        # Posiciones ordenadas por clave de celda, con sus claves y sus
+        # coordenadas proyectadas (para la verificación exacta)
+        cx, cy = self._celdas(x, y)
+        claves = np.where(validas, cy * self.ancho + cx, np.iinfo(np.int64).max)
+        orden = np.argsort(claves, kind='stable').astype(np.int64)
+        return orden, claves[orden], x[orden], y[orden]
+
+    def anexar(self, df_nuevo):
+        # Índice con df_nuevo al final: la proyección y la rejilla no cambian,
+        # las filas nuevas se ordenan aparte y se intercalan en su posición
+        nuevo = copy.copy(self)
+        lat = df_nuevo['Latitud'].to_numpy(dtype=float)
+        lon = df_nuevo['Longitud'].to_numpy(dtype=float)
+        x, y = self.proyectar(lat, lon)
+        orden, claves, x, y = self._ordenar(x, y, np.isfinite(lat) & np.isfinite(lon))
+        insertar = np.searchsorted(self.claves, claves, side='right')
+        nuevo.orden = np.insert(self.orden, insertar, orden + self.filas)
+        nuevo.claves = np.insert(self.claves, insertar, claves)
+        nuevo.x = np.insert(self.x, insertar, x)
+        nuevo.y = np.insert(self.y, insertar, y)
+        nuevo.filas = self.filas + len(df_nuevo)
+        return nuevo
+
+    @property
+    def nbytes(self):
+        return int(self.orden.nbytes + self.claves.nbytes + self.x.nbytes + self.y.nbytes)
+
+    def proyectar(self, lat, lon):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        return lon * METROS_POR_GRADO * self._coseno, lat * METROS_POR_GRADO
+
+    def _celdas(self, x, y):
+        # Las filas anexadas fuera del rectángulo original caen en las celdas
+        # del borde; las consultas se recortan igual y la verificación exacta
+        # las separa
+        cx = np.floor((np.asarray(x) - self.x_min) / self.metros_celda).astype(np.int64)
+        cy = np.floor((np.asarray(y) - self.y_min) / self.metros_celda).astype(np.int64)
+        return np.clip(cx, 0, self.ancho - 1), np.clip(cy, 0, None)
+
+    def _candidatos(self, x_min, x_max, y_min, y_max):
+        # Tramos del arreglo ordenado que cubren el rectángulo proyectado
+        (cx0, cx1), (cy0, cy1) = self._celdas([x_min, x_max], [y_min, y_max])
+        filas = np.arange(cy0, cy1 + 1) * self.ancho
+        inicios = np.searchsorted(self.claves, filas + cx0, side='left')
+        fines = np.searchsorted(self.claves, filas + cx1, side='right')
+        tramos = [np.arange(i, f) for i, f in zip(inicios, fines) if f > i]
+        return np.concatenate(tramos) if tramos else np.array([], dtype=np.int64)
+
+    def desproyectar(self, x, y):
+        return y / METROS_POR_GRADO, x / (METROS_POR_GRADO * self._coseno)
+
+    def radio(self, lat, lon, metros):
+        # Posiciones a menos de metros del punto, con la misma distancia
+        # haversine de las métricas de rutas. El rectángulo de candidatos se
+        # ensancha un 1% para cubrir la diferencia con la proyección.
+        x, y = self.proyectar(lat, lon)
+        escala = np.cos(np.radians(lat)) / self._coseno
+        margen = 1.01 * metros
+        candidatos = self._candidatos(x - margen / min(escala, 1.0), x + margen / min(escala, 1.0),
+                                      y - margen, y + margen)
+        lat_c, lon_c = self.desproyectar(self.x[candidatos], self.y[candidatos])
+        cerca = haversine_km(lat_c, lon_c, lat, lon) * 1000 <= metros
+        return np.sort(self.orden[candidatos[cerca]])
+
+    def caja(self, lat_min, lat_max, lon_min, lon_max):
+        x0, y0 = self.proyectar(lat_min, lon_min)
+        x1, y1 = self.proyectar(lat_max, lon_max)
+        candidatos = self._candidatos(min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1))
+        dentro = ((self.x[candidatos] >= min(x0, x1)) & (self.x[candidatos] <= max(x0, x1))
+                  & (self.y[candidatos] >= min(y0, y1)) & (self.y[candidatos] <= max(y0, y1)))
+        return np.sort(self.orden[candidatos[dentro]])
+
+    def poligono(self, lat, lon):
+        # Selección con lazo: candidatos del rectángulo que lo contiene y
+        # prueba de punto en polígono (par-impar) sobre ellos
+        px, py = self.proyectar(lat, lon)
+        if len(px) < 3:
+            return np.array([], dtype=np.int64)
+        candidatos = self._candidatos(px.min(), px.max(), py.min(), py.max())
+        x, y = self.x[candidatos], self.y[candidatos]
+        dentro = np.zeros(len(candidatos), dtype=bool)
+        for i in range(len(px)):
+            x1, y1, x2, y2 = px[i - 1], py[i - 1], px[i], py[i]
+            cruza = (y1 > y) != (y2 > y)
+            if y1 != y2:
+                dentro ^= cruza & (x < (x2 - x1) * (y - y1) / (y2 - y1) + x1)
+        return np.sort(self.orden[candidatos[dentro]])
+
+    def bits(self, posiciones):
+        # Máscara empaquetada para combinar con los bitmaps de IndiceFiltros
+        mascara = np.zeros(self.filas, dtype=bool)
+        mascara[posiciones] = True
+        return _empaquetar(mascara)
+
+
+def obtener_espacial(conjunto):
+    return conjunto.derivado('espacial', IndiceEspacial)
+
+
+def leer_seleccion(seleccion):
+    # Zona a partir del selectedData del mapa (caja o lazo), o None
+    if not seleccion:
+        return None
+    if 'lassoPoints' in seleccion and seleccion['lassoPoints'].get('mapbox'):
+        puntos = seleccion['lassoPoints']['mapbox']
+        return {'tipo': 'lazo', 'lon': [p[0] for p in puntos], 'lat': [p[1] for p in puntos]}
+    if 'range' in seleccion and seleccion['range'].get('mapbox'):
+        (lon0, lat0), (lon1, lat1) = seleccion['range']['mapbox']
+        return {'tipo': 'caja', 'lat_min': min(lat0, lat1), 'lat_max': max(lat0, lat1),
+                'lon_min': min(lon0, lon1), 'lon_max': max(lon0, lon1)}
+    return None
+
+
+def bits_zona(conjunto, zona):
+    # Bitmap de la zona para IndiceFiltros.mascara(area=...); None sin zona
+    if not zona:
+        return None
+    espacial = obtener_espacial(conjunto)
+    if zona['tipo'] == 'radio':
+        posiciones = espacial.radio(zona['lat'], zona['lon'], zona['metros'])
+    elif zona['tipo'] == 'caja':
+        posiciones = espacial.caja(zona['lat_min'], zona['lat_max'], zona['lon_min'], zona['lon_max'])
+    elif zona['tipo'] == 'lazo':
+        posiciones = espacial.poligono(zona['lat'], zona['lon'])
+    else:
+        raise ValueError(f"Tipo de zona desconocido: {zona['tipo']}")
+    return espacial.bits(posiciones)
+
+
+def describir_zona(zona):
+    if not zona:
+        return "Sin zona"
+    if zona['tipo'] == 'radio':
+        return f"A {zona['metros']:g} m de ({zona['lat']:.5f}, {zona['lon']:.5f})"
+    if zona['tipo'] == 'caja':
+        return "Dentro del rectángulo seleccionado"
+    return f"Dentro del lazo seleccionado ({len(zona['lat'])} vértices)"
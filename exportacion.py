@@ -0,0 +1,190 @@
+import json
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from flask import Response, abort, request, stream_with_context
+
+from almacen import almacen
+from espacial import bits_zona
+from figuras import COLOR_DEFECTO
+from indice import COLUMNA_NODO, COLUMNA_OT, obtener_indice
+
+FILAS_POR_BLOQUE = 10000
+FORMATOS = {
+    'geojson': ('application/geo+json', 'geojson'),
+    'kml': ('application/vnd.google-earth.kml+xml', 'kml'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+COLUMNAS_CSV = ['Tecnico_Clean', COLUMNA_OT, COLUMNA_NODO, 'FechaCreacion', 'Secuencia',
+                'Latitud', 'Longitud', 'Ubicacion']
+
+
+def orden_rutas(df, posiciones):
+    # Posiciones ordenadas por técnico y fecha (el orden de las rutas del
+    # mapa) y número de secuencia de cada punto dentro de su técnico
+    tecnicos = df['Tecnico_Clean'].cat.codes.to_numpy()[posiciones]
+    fechas = df['FechaCreacion'].to_numpy()[posiciones]
+    orden = np.lexsort((fechas, tecnicos))
+    posiciones, tecnicos = posiciones[orden], tecnicos[orden]
+    inicios = np.flatnonzero(np.r_[True, tecnicos[1:] != tecnicos[:-1]])
+    largos = np.diff(np.r_[inicios, len(posiciones)])
+    secuencia = np.arange(len(posiciones)) - np.repeat(inicios, largos) + 1
+    return posiciones, secuencia, inicios, largos
+
+
+def _bloques(df, posiciones, secuencia):
+    for inicio in range(0, len(posiciones), FILAS_POR_BLOQUE):
+        bloque = df.iloc[posiciones[inicio:inicio + FILAS_POR_BLOQUE]]
+        yield bloque.assign(Secuencia=secuencia[inicio:inicio + FILAS_POR_BLOQUE])
+
+
+def _codificar(serie, funcion):
+    # Aplica funcion (escape JSON o XML) solo a los valores distintos
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    textos = np.array([funcion(v) for v in unicos], dtype=object)
+    return pd.Series(textos[codigos], index=serie.index)
+
+
+def _texto(valor):
+    return '' if valor is None or valor is pd.NaT or (isinstance(valor, float) and np.isnan(valor)) else str(valor)
+
+
+def _fecha_iso(serie):
+    return serie.dt.strftime('%Y-%m-%dT%H:%M:%S').fillna('')
+
+
+def _coordenadas(bloque):
+    return (pd.Series(np.char.mod('%.6f', bloque['Longitud'].to_numpy(dtype=float)), index=bloque.index) + ','
+            + pd.Series(np.char.mod('%.6f', bloque['Latitud'].to_numpy(dtype=float)), index=bloque.index))
+
+
+def generar_csv(df, posiciones, secuencia, inicios, largos, colores):
+    yield ','.join(COLUMNAS_CSV) + '\n'
+    for bloque in _bloques(df, posiciones, secuencia):
+        bloque = bloque[COLUMNAS_CSV].assign(FechaCreacion=_fecha_iso(bloque['FechaCreacion']))
+        yield bloque.to_csv(index=False, header=False)
+
+
+def _tramos(df, posiciones, inicios, largos):
+    # Ruta de cada técnico: sus puntos en orden, como texto "lon,lat"
+    lon = df['Longitud'].to_numpy(dtype=float)
+    lat = df['Latitud'].to_numpy(dtype=float)
+    categorias = df['Tecnico_Clean'].cat.categories
+    codigos = df['Tecnico_Clean'].cat.codes.to_numpy()
+    for inicio, largo in zip(inicios, largos):
+        if largo < 2:
+            continue
+        tramo = posiciones[inicio:inicio + largo]
+        codigo = codigos[tramo[0]]
+        tecnico = categorias[codigo] if codigo >= 0 else ''
+        yield tecnico, np.char.add(np.char.add(np.char.mod('%.6f', lon[tramo]), ','),
+                                   np.char.mod('%.6f', lat[tramo]))
+
+
+def generar_geojson(df, posiciones, secuencia, inicios, largos, colores):
+    yield '{"type":"FeatureCollection","features":['
+    separador = ''
+    for bloque in _bloques(df, posiciones, secuencia):
+        propiedades = (
+            '{"tecnico":' + _codificar(bloque['Tecnico_Clean'].astype(object), lambda v: json.dumps(_texto(v)))
+            + ',"ot":' + _codificar(bloque[COLUMNA_OT], lambda v: json.dumps(_texto(v)))
+            + ',"nodo":' + _codificar(bloque[COLUMNA_NODO], lambda v: json.dumps(_texto(v)))
+            + ',"fecha":"' + _fecha_iso(bloque['FechaCreacion'])
+            + '","secuencia":' + bloque['Secuencia'].astype(str)
+            + ',"ubicacion":' + _codificar(bloque['Ubicacion'], lambda v: json.dumps(_texto(v))) + '}'
+        )
+        entidades = ('{"type":"Feature","geometry":{"type":"Point","coordinates":['
+                     + _coordenadas(bloque) + ']},"properties":' + propiedades + '}')
+        yield separador + ','.join(entidades)
+        separador = ','
+    for tecnico, coordenadas in _tramos(df, posiciones, inicios, largos):
+        yield (separador + '{"type":"Feature","geometry":{"type":"LineString","coordinates":[['
+               + '],['.join(coordenadas) + ']]},"properties":{"tecnico":' + json.dumps(str(tecnico))
+               + ',"tipo":"ruta","color":' + json.dumps(colores.get(tecnico, COLOR_DEFECTO)) + '}}')
+        separador = ','
+    yield ']}\n'
+
+
+def color_kml(color):
+    # "rgb(r,g,b)" -> aabbggrr
+    try:
+        r, g, b = (int(c) for c in color[color.index('(') + 1:color.index(')')].split(','))
+    except ValueError:
+        return 'ff808080'
+    return f"ff{b:02x}{g:02x}{r:02x}"
+
+
+def generar_kml(df, posiciones, secuencia, inicios, largos, colores):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<kml xmlns="http://www.opengis.net/kml/2.2"><Document><name>Instalaciones</name>\n')
+    for i, tecnico in enumerate(df['Tecnico_Clean'].cat.categories):
+        color = color_kml(colores.get(tecnico, COLOR_DEFECTO))
+        yield (f'<Style id="t{i}"><IconStyle><color>{color}</color></IconStyle>'
+               f'<LineStyle><color>{color}</color><width>2</width></LineStyle></Style>\n')
+
+    yield '<Folder><name>Puntos</name>\n'
+    for bloque in _bloques(df, posiciones, secuencia):
+        tecnicos = _codificar(bloque['Tecnico_Clean'].astype(object), lambda v: escape(_texto(v)))
+        marcas = (
+            '<Placemark><name>' + tecnicos + ' #' + bloque['Secuencia'].astype(str) + '</name>'
+            + '<styleUrl>#t' + pd.Series(bloque['Tecnico_Clean'].cat.codes.to_numpy(), index=bloque.index).astype(str)
+            + '</styleUrl><ExtendedData>'
+            + '<Data name="OT"><value>' + _codificar(bloque[COLUMNA_OT], lambda v: escape(_texto(v)))
+            + '</value></Data><Data name="Nodo"><value>' + _codificar(bloque[COLUMNA_NODO], lambda v: escape(_texto(v)))
+            + '</value></Data><Data name="FechaCreacion"><value>' + _fecha_iso(bloque['FechaCreacion'])
+            + '</value></Data></ExtendedData><TimeStamp><when>' + _fecha_iso(bloque['FechaCreacion'])
+            + '</when></TimeStamp><Point><coordinates>' + _coordenadas(bloque)
+            + '</coordinates></Point></Placemark>\n'
+        )
+        yield ''.join(marcas)
+    yield '</Folder>\n<Folder><name>Rutas</name>\n'
+
+    indices = {t: i for i, t in enumerate(df['Tecnico_Clean'].cat.categories)}
+    for tecnico, coordenadas in _tramos(df, posiciones, inicios, largos):
+        yield (f'<Placemark><name>Ruta {escape(str(tecnico))}</name><styleUrl>#t{indices.get(tecnico, 0)}</styleUrl>'
+               '<LineString><tessellate>1</tessellate><coordinates>'
+               + ' '.join(coordenadas) + '</coordinates></LineString></Placemark>\n')
+    yield '</Folder></Document></kml>\n'
+
+
+GENERADORES = {'geojson': generar_geojson, 'kml': generar_kml, 'csv': generar_csv}
+
+
+def exportar(formato):
+    """Descarga de los puntos y rutas filtrados, generada por bloques.
+
+    Usa los mismos filtros que el mapa (parámetros clave, tecnico -repetible-,
+    ot, nodo, fecha, hora y zona, esta última en JSON). La respuesta se transmite a medida que se
+    genera: solo un bloque de filas está convertido a texto a la vez.
+    """
+    if formato not in FORMATOS:
+        abort(404)
+    conjunto = almacen.obtener(request.args.get('clave'))
+    if conjunto is None:
+        abort(404, "Dataset no encontrado; vuelva a cargar el archivo")
+    try:
+        zona = json.loads(request.args.get('zona') or 'null')
+    except ValueError:
+        abort(400, "Parámetro zona inválido")
+
+    posiciones = obtener_indice(conjunto).posiciones(
+        tecnicos=request.args.getlist('tecnico') or None,
+        ot=request.args.get('ot') or None,
+        nodo=request.args.get('nodo') or None,
+        fecha=request.args.get('fecha') or None,
+        hora=request.args.get('hora') or None,
+        area=bits_zona(conjunto, zona),
+    )
+    orden = orden_rutas(conjunto.df, posiciones)
+    tipo, extension = FORMATOS[formato]
+    contenido = GENERADORES[formato](conjunto.df, *orden, conjunto.colores)
+    return Response(
+        stream_with_context(contenido),
+        mimetype=tipo,
+        headers={'Content-Disposition': f'attachment; filename="instalaciones.{extension}"'}
+    )
+
+
+def registrar_exportacion(server):
+    server.add_url_rule('/exportar/<formato>', 'exportar', exportar)
@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+
+# Las trazas se construyen como dicts: plotly valida y copia elemento por
+# elemento los arreglos de go.Scattermapbox, lo que domina el tiempo con
+# decenas de miles de puntos. Dash serializa los dicts directamente.
+
+COLOR_DEFECTO = "rgb(128,128,128)"
+COLOR_RUTAS_UNIFICADAS = "rgb(52,58,64)"
+COLUMNAS_DETALLE = [
+    'Tecnico_Clean',
+    '2.Nro de O.T.',
+    '1.NODO DEL POSTE.',
+    'FechaCreacion',
+    'Latitud',
+    'Longitud',
+    'Ubicacion'
+]
+
+
+def como_texto(serie, formato=None):
+    # Convierte a texto solo los valores distintos y los reparte por fila
+    codigos, unicos = pd.factorize(serie)
+    if formato is not None:
+        textos = pd.Index(unicos).strftime(formato)
+    else:
+        textos = pd.Index(unicos).astype(str)
+    textos = np.append(np.asarray(textos, dtype=object), '')
+    return pd.Series(textos[codigos], index=serie.index)
+
+
+def _coordenada(serie):
+    # Coordenadas para el navegador: 6 decimales (~0.1 m). Redondear en
+    # float64 evita que las columnas float32 viajen con 16 dígitos.
+    return np.round(serie.to_numpy(dtype=float), 6)
+
+
+def _formato_coordenada(serie):
+    return pd.Series(np.char.mod('%.5f', serie.to_numpy(dtype=float)), index=serie.index, dtype=object)
+
+
+def texto_hover(df, saltos=None):
+    # Concatenación por columnas en lugar de un f-string por fila
+    texto = (
+        "Técnico: " + como_texto(df['Tecnico_Clean']) + "<br>" +
+        "OT: " + como_texto(df['2.Nro de O.T.']) + "<br>" +
+        "Nodo: " + como_texto(df['1.NODO DEL POSTE.']) + "<br>" +
+        "Fecha Creación: " + como_texto(df['FechaCreacion'], '%d/%m/%Y %H:%M') + "<br>" +
+        "Latitud: " + _formato_coordenada(df['Latitud']) + "<br>" +
+        "Longitud: " + _formato_coordenada(df['Longitud'])
+    ).to_numpy()
+    if saltos is not None:
+        # saltos: velocidad de llegada por fila, NaN si no es un salto imposible
+        marcadas = np.flatnonzero(~np.isnan(saltos))
+        velocidad = saltos[marcadas]
+        detalle = np.where(np.isinf(velocidad), 'sin tiempo desde la anterior',
+                           np.char.mod('%.0f km/h desde la anterior', velocidad))
+        texto[marcadas] = texto[marcadas] + '<br><b>Salto imposible</b>: ' + detalle.astype(object)
+    return texto
+
+
+def datos_detalle(df):
+    detalle = df[COLUMNAS_DETALLE].copy()
+    detalle['Tecnico_Clean'] = como_texto(detalle['Tecnico_Clean'])
+    detalle['FechaCreacion'] = como_texto(detalle['FechaCreacion'], '%Y-%m-%dT%H:%M:%S')
+    detalle['Latitud'] = _coordenada(detalle['Latitud'])
+    detalle['Longitud'] = _coordenada(detalle['Longitud'])
+    return detalle.to_numpy()
+
+
+def colores_por_fila(df, colores):
+    categorias = df['Tecnico_Clean'].cat.categories
+    paleta = np.array([colores.get(t, COLOR_DEFECTO) for t in categorias] + [COLOR_DEFECTO], dtype=object)
+    return paleta[df['Tecnico_Clean'].cat.codes.to_numpy()]
+
+
+def marcador_por_tecnico(df, colores, size=12):
+    # Color por código de categoría con una escala discreta: el navegador
+    # recibe un entero por punto en lugar de una cadena rgb(...)
+    categorias = list(df['Tecnico_Clean'].cat.categories)
+    paleta = [colores.get(t, COLOR_DEFECTO) for t in categorias] + [COLOR_DEFECTO]
+    codigos = df['Tecnico_Clean'].cat.codes.to_numpy().astype(np.int32)
+    codigos[codigos < 0] = len(categorias)
+    escala = []
+    for i, color in enumerate(paleta):
+        escala.append([i / len(paleta), color])
+        escala.append([(i + 1) / len(paleta), color])
+    return dict(
+        size=size, color=codigos, colorscale=escala,
+        cmin=-0.5, cmax=len(paleta) - 0.5, showscale=False
+    )
+
+
+def traza_puntos(df, colores, saltos=None):
+    # Única traza con marcadores, texto de secuencia, hover y customdata
+    return dict(
+        type='scattermapbox',
+        lat=_coordenada(df['Latitud_adj']),
+        lon=_coordenada(df['Longitud_adj']),
+        mode='markers+text',
+        marker=marcador_por_tecnico(df, colores),
+        text=df['Secuencia'].to_numpy(),
+        textposition="top center",
+        textfont=dict(size=12, color="black"),
+        customdata=datos_detalle(df),
+        hoverinfo='text',
+        hovertext=texto_hover(df, saltos),
+        name='Puntos'
+    )
+
+
+def _lineas_con_separadores(df, codigos=None):
+    # Une las rutas de varios técnicos en un solo arreglo separado por NaN
+    lat = _coordenada(df['Latitud_adj'])
+    lon = _coordenada(df['Longitud_adj'])
+    if codigos is None:
+        codigos = df['Tecnico_Clean'].cat.codes.to_numpy()
+    cortes = np.flatnonzero(codigos[1:] != codigos[:-1]) + 1
+    return np.insert(lat, cortes, np.nan), np.insert(lon, cortes, np.nan)
+
+
+def _traza_lineas(lat, lon, color, nombre):
+    return dict(
+        type='scattermapbox', lat=lat, lon=lon, mode='lines', hoverinfo='skip',
+        line=dict(width=2, color=color), name=nombre
+    )
+
+
+def trazas_rutas(df, colores, unificadas=False, tramos=None):
+    # df debe venir ordenado por técnico y fecha. Las rutas son solo líneas:
+    # los puntos, el hover y customdata ya van en la traza de puntos.
+    # tramos (opcional) numera por fila los trozos de ruta que se dibujan
+    # unidos; por defecto cada técnico es un trozo.
+    if df.empty:
+        return []
+    if unificadas:
+        lat, lon = _lineas_con_separadores(df, tramos)
+        return [_traza_lineas(lat, lon, COLOR_RUTAS_UNIFICADAS, 'Rutas')]
+    
+    # Una traza por color: técnicos con el mismo color comparten traza
+    color_fila = colores_por_fila(df, colores)
+    trazas = []
+    for color in pd.unique(color_fila):
+        mascara = color_fila == color
+        grupo = df[mascara]
+        tecnicos = grupo['Tecnico_Clean'].unique()
+        lat, lon = _lineas_con_separadores(grupo, None if tramos is None else tramos[mascara])
+        nombre = f'Ruta {tecnicos[0]}' if len(tecnicos) == 1 else 'Rutas ' + ', '.join(map(str, tecnicos))
+        trazas.append(_traza_lineas(lat, lon, color, nombre))
+    return trazas
+
+
+def traza_grupos(lat, lon, conteo):
+    # Grupos de la rejilla: tamaño proporcional a la raíz del número de puntos
+    maximo = conteo.max() if len(conteo) else 1
+    return dict(
+        type='scattermapbox',
+        lat=lat,
+        lon=lon,
+        mode='markers+text',
+        marker=dict(size=12 + 28 * np.sqrt(conteo / maximo), color='rgb(0,123,255)', opacity=0.6),
+        text=conteo,
+        textposition="middle center",
+        textfont=dict(size=11, color="black"),
+        hoverinfo='text',
+        hovertext=np.char.add(conteo.astype(str), ' instalaciones'),
+        name='Grupos de instalaciones'
+    )
+
+
+def traza_densidad(lat, lon, conteo, radio):
+    # Mapa de calor a partir de los conteos por celda, no de los puntos
+    return dict(
+        type='densitymapbox',
+        lat=np.round(lat, 5),
+        lon=np.round(lon, 5),
+        z=conteo,
+        radius=radio,
+        colorscale='YlOrRd',
+        opacity=0.7,
+        hovertemplate='%{z} instalaciones<extra></extra>',
+        colorbar=dict(title='Instalaciones'),
+        name='Densidad'
+    )
+
+
+def trazas_optimizadas(df, resultados, sin_resolver):
+    # Recorrido real y recorrido optimizado de cada técnico-día analizado
+    if not resultados:
+        return []
+    reales, optimas = [], []
+    km_real = km_optimo = 0.0
+    for posiciones, ruta, real, optima in resultados.values():
+        reales.append(posiciones)
+        optimas.append(posiciones[ruta])
+        km_real += real
+        km_optimo += optima
+    
+    trazas = []
+    for nombre, grupos, color in (
+        (f'Recorrido real ({km_real:.1f} km)', reales, COLOR_RUTAS_UNIFICADAS),
+        (f'Recorrido optimizado ({km_optimo:.1f} km, ahorro {km_real - km_optimo:.1f} km)',
+         optimas, 'rgb(220,53,69)'),
+    ):
+        orden = np.concatenate(grupos)
+        codigos = np.repeat(np.arange(len(grupos)), [len(g) for g in grupos])
+        lat, lon = _lineas_con_separadores(df.iloc[orden], codigos)
+        trazas.append(_traza_lineas(lat, lon, color, nombre))
+    if sin_resolver:
+        trazas[-1]['name'] += f' - {sin_resolver} técnico-días pendientes'
+    return trazas
+
+
+def trazas_reproduccion(df, tecnicos, colores):
+    # Trazas vacías de la reproducción: los puntos y una línea por técnico,
+    # que el navegador extiende fotograma a fotograma. Las líneas llevan los
+    # mismos campos que los puntos porque extendData extiende todas las
+    # trazas de una vez con las mismas claves.
+    trazas = [traza_puntos(df.iloc[:0], colores)]
+    for tecnico in tecnicos:
+        linea = _traza_lineas([], [], colores.get(tecnico, COLOR_DEFECTO), f'Ruta {tecnico}')
+        linea.update(text=[], hovertext=[], customdata=[])
+        linea['marker'] = dict(color=[])
+        trazas.append(linea)
+    return trazas
@@ -0,0 +1,31 @@
+# Configuración de gunicorn para producción: gunicorn -c gunicorn.conf.py wsgi:server
+#
+# Cada worker tiene su propio almacén en memoria, pero todos escriben y leen
+# los datasets procesados en la misma caché en disco (MAPA_DIRECTORIO_CACHE),
+# así que cualquier worker puede atender los callbacks de cualquier archivo.
+# Las columnas se abren con memory-mapping, de modo que los workers comparten
+# las páginas del sistema operativo en lugar de tener una copia cada uno.
+# /metrics suma las métricas de todos los workers y de las tareas en segundo
+# plano, que cada proceso deja en MAPA_DIRECTORIO_METRICAS.
+import multiprocessing
+import os
+
+bind = os.environ.get('MAPA_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('MAPA_WORKERS', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get('MAPA_THREADS', '4'))
+worker_class = 'gthread'
+
+# Importa la app (pandas, plotly, dash) una vez en el maestro antes del fork
+preload_app = True
+
+# Una carga grande puede tardar; el resto de callbacks responde en segundos
+timeout = int(os.environ.get('MAPA_TIMEOUT', '120'))
+graceful_timeout = 30
+
+# Reparte los procesos de optimización de rutas entre los workers
+os.environ.setdefault(
+    'MAPA_PROCESOS_OPTIMIZACION', str(max(multiprocessing.cpu_count() // workers, 1))
+)
+
+accesslog = '-'
+errorlog = '-'
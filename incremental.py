@@ -0,0 +1,138 @@
+import copy
+import hashlib
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from espacial import obtener_espacial
+from indice import COLUMNA_OT, obtener_indice
+from ingesta import compactar
+from metricas_rutas import obtener_metricas
+from niveles import obtener_rejilla
+from utilities import ajustar_coordenadas, generar_colores
+
+
+def _claves_filas(df):
+    # Una instalación se identifica por su OT y su FechaCreacion
+    return pd.util.hash_pandas_object(pd.DataFrame({
+        'ot': df[COLUMNA_OT].astype(str).to_numpy(),
+        'fecha': df['FechaCreacion'].to_numpy()
+    }), index=False).to_numpy()
+
+
+def _claves_coordenadas(df):
+    # Coordenadas en float64 (el tipo fijo de compactar) redondeadas a los 6
+    # decimales que se exportan, para que base y archivo anexado coincidan
+    return pd.util.hash_pandas_object(pd.DataFrame({
+        'lat': np.round(df['Latitud'].to_numpy(dtype=np.float64), 6),
+        'lon': np.round(df['Longitud'].to_numpy(dtype=np.float64), 6)
+    }), index=False).to_numpy()
+
+
+def _buscar(ordenado, valores):
+    # Búsqueda binaria de valores en un arreglo ordenado
+    if len(ordenado) == 0:
+        return np.zeros(len(valores), dtype=bool), np.zeros(len(valores), dtype=np.int64)
+    posiciones = np.minimum(np.searchsorted(ordenado, valores), len(ordenado) - 1)
+    return ordenado[posiciones] == valores, posiciones
+
+
+def _alinear_categorias(base, df_nuevo):
+    # Las columnas categóricas del dataset siguen siéndolo tras anexar: las
+    # categorías nuevas van al final, así los códigos existentes no cambian
+    cambios_base, cambios_nuevo = {}, {}
+    for columna in base.columns:
+        if columna == 'Tecnico_Clean' or not isinstance(base[columna].dtype, pd.CategoricalDtype):
+            continue
+        categorias = base[columna].cat.categories
+        valores = pd.Index(pd.unique(df_nuevo[columna].dropna().to_numpy()))
+        categorias = categorias.append(valores[~valores.isin(categorias)])
+        cambios_base[columna] = base[columna].cat.set_categories(categorias)
+        cambios_nuevo[columna] = df_nuevo[columna].astype(object).astype(pd.CategoricalDtype(categorias))
+    return base.assign(**cambios_base), df_nuevo.assign(**cambios_nuevo)
+
+
+def combinar_clave(clave_base, clave_nueva):
+    return hashlib.sha256(f"{clave_base}+{clave_nueva}".encode()).hexdigest()
+
+
+class EstadoIncremental:
+    """Lo necesario para anexar archivos a un dataset sin recorrerlo entero:
+    claves OT+fecha ordenadas, conteo de puntos por coordenada y rango de fechas.
+    """
+
+    def __init__(self, df):
+        self.claves = np.sort(_claves_filas(df))
+        self.coordenadas, self.conteo = np.unique(_claves_coordenadas(df), return_counts=True)
+        self.fecha_min = df['FechaCreacion'].min()
+        self.fecha_max = df['FechaCreacion'].max()
+
+    @property
+    def nbytes(self):
+        return int(self.claves.nbytes + self.coordenadas.nbytes + self.conteo.nbytes)
+
+    def anexar(self, df_nuevo):
+        nuevo = copy.copy(self)
+        claves = np.sort(_claves_filas(df_nuevo))
+        nuevo.claves = np.insert(self.claves, np.searchsorted(self.claves, claves), claves)
+
+        coordenadas, conteo = np.unique(_claves_coordenadas(df_nuevo), return_counts=True)
+        existe, posiciones = _buscar(self.coordenadas, coordenadas)
+        nuevo.conteo = self.conteo.copy()
+        np.add.at(nuevo.conteo, posiciones[existe], conteo[existe])
+        insertar = np.searchsorted(self.coordenadas, coordenadas[~existe])
+        nuevo.coordenadas = np.insert(self.coordenadas, insertar, coordenadas[~existe])
+        nuevo.conteo = np.insert(nuevo.conteo, insertar, conteo[~existe])
+
+        fechas = pd.concat([df_nuevo['FechaCreacion'], pd.Series([self.fecha_min, self.fecha_max])])
+        nuevo.fecha_min, nuevo.fecha_max = fechas.min(), fechas.max()
+        return nuevo
+
+    def previos(self, df):
+        # Puntos que ya había en el dataset con las coordenadas de cada fila
+        existe, posiciones = _buscar(self.coordenadas, _claves_coordenadas(df))
+        return np.where(existe, self.conteo[posiciones], 0)
+
+
+def obtener_estado(conjunto):
+    return conjunto.derivado('incremental', EstadoIncremental)
+
+
+def anexar(conjunto, df_nuevo):
+    """Agrega al dataset un archivo ya procesado por separado.
+
+    Descarta las filas cuya OT+FechaCreacion ya existe (en el dataset o
+    repetida en el propio archivo), continúa el ajuste de coordenadas a
+    partir de los puntos existentes y extiende las estructuras derivadas
+    (índices, rejillas, métricas), los colores y el rango de fechas sin
+    reconstruirlos. Devuelve el DataFrame combinado, los colores, las
+    estructuras derivadas y un resumen.
+    """
+    estado = obtener_estado(conjunto)
+    claves = _claves_filas(df_nuevo)
+    repetidas = _buscar(estado.claves, claves)[0] | pd.Series(claves).duplicated().to_numpy()
+    df_nuevo = df_nuevo[~repetidas]
+    df_nuevo = compactar(ajustar_coordenadas(df_nuevo, previos=estado.previos(df_nuevo)))
+    
+    base, df_nuevo = _alinear_categorias(conjunto.df, df_nuevo)
+    categorias = union_categoricals(
+        [base['Tecnico_Clean'], df_nuevo['Tecnico_Clean']], sort_categories=True
+    ).categories
+    df_nuevo = df_nuevo.assign(Tecnico_Clean=df_nuevo['Tecnico_Clean'].cat.set_categories(categorias))
+    df = pd.concat(
+        [base.assign(Tecnico_Clean=base['Tecnico_Clean'].cat.set_categories(categorias)), df_nuevo],
+        ignore_index=True
+    )
+    
+    colores = dict(conjunto.colores)
+    colores.update(generar_colores([t for t in df_nuevo['Tecnico_Clean'].unique() if t not in colores]))
+    derivados = {
+        'indice': obtener_indice(conjunto).anexar(df_nuevo),
+        'incremental': estado.anexar(df_nuevo),
+        'rejilla': obtener_rejilla(conjunto).anexar(df_nuevo),
+        'espacial': obtener_espacial(conjunto).anexar(df_nuevo),
+        'metricas': obtener_metricas(conjunto).anexar(df_nuevo, df),
+    }
+    resumen = {'filas_nuevas': len(df_nuevo), 'duplicadas': int(repetidas.sum()), 'filas_totales': len(df)}
+    return df, colores, derivados, resumen
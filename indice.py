@@ -0,0 +1,249 @@
+import copy
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+COLUMNA_OT = '2.Nro de O.T.'
+COLUMNA_NODO = '1.NODO DEL POSTE.'
+MAX_CONSULTAS_CACHE = 64
+
+
+def _empaquetar(mascara):
+    return np.packbits(mascara)
+
+
+def _tabla_codigos(total, seleccionados):
+    # Tabla de consulta código -> pertenece, para filtrar con un solo gather
+    tabla = np.zeros(total + 1, dtype=bool)
+    tabla[np.asarray(seleccionados, dtype=np.int64)] = True
+    return tabla
+
+
+def _codigos_anexados(unicos, valores):
+    # Códigos de valores respecto a unicos, agregando al final los que no estén
+    codigos_nuevos, unicos_nuevos = pd.factorize(valores, use_na_sentinel=False)
+    posiciones = unicos.get_indexer(unicos_nuevos)
+    faltan = posiciones < 0
+    posiciones[faltan] = len(unicos) + np.arange(faltan.sum())
+    return posiciones[codigos_nuevos], unicos.append(pd.Index(unicos_nuevos[faltan]))
+
+
+def _bytes_cadenas(serie):
+    # Bytes de los objetos a los que apunta una serie de texto
+    return int(serie.memory_usage(index=False, deep=True) - serie.memory_usage(index=False, deep=False))
+
+
+def _cubetas(fechas, unicos=None):
+    # Códigos de día y de hora:minuto; NaT queda con código -1
+    dias = fechas.dt.normalize()
+    minutos = fechas.dt.floor('min')
+    validas = fechas.notna().to_numpy()
+    resultado = []
+    for valores, previos in ((dias, unicos and unicos[0]), (minutos, unicos and unicos[1])):
+        if previos is None:
+            previos = pd.DatetimeIndex([], dtype='datetime64[ns]')
+        codigos = np.full(len(fechas), -1, dtype=np.int64)
+        if validas.any():
+            codigos_validos, previos = _codigos_anexados(previos, valores[validas])
+            codigos[validas] = codigos_validos
+        resultado.append((codigos, pd.DatetimeIndex(previos)))
+    return resultado
+
+
+class ColumnaTexto:
+    """Columna convertida a texto una sola vez, con búsqueda sobre sus valores distintos.
+
+    Las últimas MAX_CONSULTAS_CACHE búsquedas quedan en caché como bitmaps;
+    los hilos de las peticiones la comparten, así que se usa con un lock, y
+    su tamaño máximo se cuenta desde el principio en nbytes.
+    """
+
+    def __init__(self, serie):
+        codigos, unicos = pd.factorize(serie.astype(str), use_na_sentinel=False)
+        self.codigos = codigos.astype(np.int32)
+        self.unicos = pd.Series(unicos, dtype=object)
+        # Medir las cadenas recorre cada valor: se miden una vez al crearlas
+        self.bytes_cadenas = _bytes_cadenas(self.unicos)
+        self._consultas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # En disco no van el lock ni la caché de consultas
+        estado = self.__dict__.copy()
+        del estado['_lock']
+        estado['_consultas'] = OrderedDict()
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._lock = threading.Lock()
+
+    def anexar(self, serie):
+        # Nueva columna con las filas de serie al final; solo se convierten
+        # y se buscan los valores de las filas nuevas
+        nueva = copy.copy(self)
+        codigos, unicos = _codigos_anexados(pd.Index(self.unicos), serie.astype(str))
+        nueva.codigos = np.concatenate([self.codigos, codigos.astype(np.int32)])
+        nueva.unicos = pd.Series(unicos, dtype=object)
+        nueva.bytes_cadenas = self.bytes_cadenas + _bytes_cadenas(nueva.unicos.iloc[len(self.unicos):])
+        nueva._consultas = OrderedDict()
+        nueva._lock = threading.Lock()
+        return nueva
+
+    @property
+    def nbytes(self):
+        bits_consulta = (len(self.codigos) + 7) // 8
+        return int(self.codigos.nbytes + self.unicos.memory_usage(deep=False) + self.bytes_cadenas
+                   + MAX_CONSULTAS_CACHE * bits_consulta)
+
+    def contiene(self, patron):
+        # Mismo criterio que Series.str.contains, evaluado sobre los valores distintos
+        with self._lock:
+            bits = self._consultas.get(patron)
+            if bits is not None:
+                self._consultas.move_to_end(patron)
+                return bits
+        try:
+            coincide = self.unicos.str.contains(patron, regex=True).to_numpy(dtype=bool)
+        except re.error:
+            coincide = self.unicos.str.contains(patron, regex=False).to_numpy(dtype=bool)
+        tabla = _tabla_codigos(len(self.unicos), np.flatnonzero(coincide))
+        bits = _empaquetar(tabla[self.codigos])
+        with self._lock:
+            self._consultas[patron] = bits
+            if len(self._consultas) > MAX_CONSULTAS_CACHE:
+                self._consultas.popitem(last=False)
+        return bits
+
+
+class IndiceFiltros:
+    """Índice de filtros construido al cargar el dataset.
+
+    Cada filtro se resuelve como un bitmap empaquetado de filas y una
+    consulta combina sus filtros con AND bit a bit.
+    """
+
+    def __init__(self, df):
+        self.filas = len(df)
+        
+        # Bitmap de filas por técnico
+        tecnicos = df['Tecnico_Clean']
+        codigos = tecnicos.cat.codes.to_numpy()
+        orden = np.argsort(codigos, kind='stable')
+        limites = np.searchsorted(codigos[orden], np.arange(len(tecnicos.cat.categories) + 1))
+        self.tecnicos = {}
+        for i, tecnico in enumerate(tecnicos.cat.categories):
+            mascara = np.zeros(self.filas, dtype=bool)
+            mascara[orden[limites[i]:limites[i + 1]]] = True
+            self.tecnicos[tecnico] = _empaquetar(mascara)
+        
+        self.ot = ColumnaTexto(df[COLUMNA_OT])
+        self.nodo = ColumnaTexto(df[COLUMNA_NODO])
+        
+        # Cubetas de día y de hora:minuto
+        (self.dia_codigos, self._dias), (self.minuto_codigos, self._minutos) = _cubetas(df['FechaCreacion'])
+        self._etiquetas()
+
+    def _etiquetas(self, previo=None):
+        # Con previo (índice del que este es continuación) solo se da formato
+        # a los días y minutos agregados
+        dias, minutos = (0, 0) if previo is None else (len(previo.dias), len(previo.minutos))
+        nuevos = self._dias[dias:].strftime('%d/%m/%Y').tolist()
+        self.dias = nuevos if previo is None else previo.dias + nuevos
+        self.minutos = np.array(self._minutos[minutos:].strftime('%H:%M').tolist(), dtype='U5')
+        if previo is not None:
+            self.minutos = np.concatenate([previo.minutos, self.minutos])
+        self._dia_por_texto = {} if previo is None else dict(previo._dia_por_texto)
+        self._dia_por_texto.update((dia, dias + i) for i, dia in enumerate(nuevos))
+        self._bits_todos = _empaquetar(np.ones(self.filas, dtype=bool))
+
+    def anexar(self, df_nuevo):
+        """Índice del dataset con df_nuevo agregado al final.
+
+        df_nuevo debe usar las mismas categorías de técnico que el dataset
+        combinado. El trabajo es proporcional a las filas nuevas, salvo la
+        concatenación de los bitmaps.
+        """
+        nuevo = copy.copy(self)
+        nuevo.filas = self.filas + len(df_nuevo)
+        
+        codigos = df_nuevo['Tecnico_Clean'].cat.codes.to_numpy()
+        nuevo.tecnicos = {}
+        for i, tecnico in enumerate(df_nuevo['Tecnico_Clean'].cat.categories):
+            previo = self.tecnicos.get(tecnico)
+            previo = (np.unpackbits(previo, count=self.filas).view(bool) if previo is not None
+                      else np.zeros(self.filas, dtype=bool))
+            nuevo.tecnicos[tecnico] = _empaquetar(np.concatenate([previo, codigos == i]))
+        
+        nuevo.ot = self.ot.anexar(df_nuevo[COLUMNA_OT])
+        nuevo.nodo = self.nodo.anexar(df_nuevo[COLUMNA_NODO])
+        
+        (dias, nuevo._dias), (minutos, nuevo._minutos) = _cubetas(
+            df_nuevo['FechaCreacion'], (self._dias, self._minutos)
+        )
+        nuevo.dia_codigos = np.concatenate([self.dia_codigos, dias])
+        nuevo.minuto_codigos = np.concatenate([self.minuto_codigos, minutos])
+        nuevo._etiquetas(self)
+        return nuevo
+
+    @property
+    def nbytes(self):
+        return int(sum(bits.nbytes for bits in self.tecnicos.values())
+                   + self.ot.nbytes + self.nodo.nbytes
+                   + self.dia_codigos.nbytes + self.minuto_codigos.nbytes)
+
+    def _bits_tecnicos(self, tecnicos):
+        seleccion = [self.tecnicos[t] for t in tecnicos if t in self.tecnicos]
+        if not seleccion:
+            return np.zeros_like(self._bits_todos)
+        return np.bitwise_or.reduce(seleccion)
+
+    def _bits_fecha(self, fecha, hora=None):
+        dia = self._dia_por_texto.get(fecha)
+        if dia is None:
+            return np.zeros_like(self._bits_todos)
+        mascara = self.dia_codigos == dia
+        if hora:
+            minutos = np.flatnonzero(self.minutos == hora)
+            mascara &= _tabla_codigos(len(self.minutos), minutos)[self.minuto_codigos]
+        return _empaquetar(mascara)
+
+    def mascara(self, tecnicos=None, ot=None, nodo=None, fecha=None, hora=None, area=None):
+        # area: bitmap empaquetado de una zona (ver espacial.bits_zona)
+        bits = self._bits_todos
+        if area is not None:
+            bits = bits & area
+        if tecnicos:
+            bits = bits & self._bits_tecnicos(tecnicos)
+        if ot:
+            bits = bits & self.ot.contiene(ot)
+        if nodo:
+            bits = bits & self.nodo.contiene(nodo)
+        if fecha:
+            bits = bits & self._bits_fecha(fecha, hora)
+        return np.unpackbits(bits, count=self.filas).view(bool)
+
+    def posiciones(self, **filtros):
+        return np.flatnonzero(self.mascara(**filtros))
+
+    def fechas(self, posiciones):
+        codigos = np.unique(self.dia_codigos[posiciones])
+        return sorted(self.dias[c] for c in codigos if c >= 0)
+
+    def horas_por_fecha(self, posiciones):
+        # Horas de cada fecha, para que el navegador llene el filtro de hora
+        codigos = np.unique(self.minuto_codigos[posiciones])
+        codigos = codigos[codigos >= 0]
+        orden = np.argsort(self._minutos[codigos])
+        codigos = codigos[orden]
+        resultado = {}
+        for dia, hora in zip(self._minutos[codigos].strftime('%d/%m/%Y'), self.minutos[codigos]):
+            resultado.setdefault(dia, []).append(str(hora))
+        return resultado
+
+
+def obtener_indice(conjunto):
+    return conjunto.derivado('indice', IndiceFiltros)
@@ -0,0 +1,238 @@
+import csv
+import io
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from utilities import (ajustar_coordenadas, cargar_alias, convertir_fechas_columna,
+                       generar_colores, normalizar_tecnicos, parse_coord_columna)
+
+COLUMNA_TECNICO = '4.Nombre del Técnico Instalador'
+COLUMNAS_USADAS = [
+    COLUMNA_TECNICO,
+    '2.Nro de O.T.',
+    '1.NODO DEL POSTE.',
+    'Latitud',
+    'Longitud',
+    'FechaCreacion',
+    'Ubicacion'
+]
+FORMATOS_SOPORTADOS = ('.xlsx', '.xlsm', '.csv', '.parquet')
+# Subir este número cuando un cambio del proceso altere los datos resultantes
+VERSION_PROCESO = 5
+TAMANO_BLOQUE = 20000
+
+# Esquema compacto del dataset procesado: solo las columnas que usa la
+# aplicación y texto repetitivo como categórica. El tipo de las coordenadas
+# es fijo por columna, no por archivo, para que un archivo anexado compare
+# igual con el dataset: las originales (exportadas, claves de duplicados)
+# quedan en float64; las ajustadas solo se dibujan y van en float32 (<1 m).
+COLUMNAS_FINALES = [
+    'Tecnico_Clean',
+    '2.Nro de O.T.',
+    '1.NODO DEL POSTE.',
+    'FechaCreacion',
+    'Latitud',
+    'Longitud',
+    'Ubicacion',
+    'Latitud_adj',
+    'Longitud_adj'
+]
+COLUMNAS_CATEGORICAS = ['2.Nro de O.T.', '1.NODO DEL POSTE.', 'Ubicacion']
+PROPORCION_CATEGORIA = 0.5
+COLUMNAS_FLOAT32 = ['Latitud_adj', 'Longitud_adj']
+
+
+class ErrorIngesta(ValueError):
+    pass
+
+
+def _sin_progreso(etapa, hechas, total):
+    pass
+
+
+def _columnas_faltantes(encabezado):
+    faltan = [c for c in COLUMNAS_USADAS if c not in encabezado]
+    if faltan:
+        raise ErrorIngesta(f"Faltan columnas en el archivo: {', '.join(faltan)}")
+
+
+def _bloques_excel(fuente, tamano_bloque):
+    import openpyxl
+    
+    # Modo solo lectura: openpyxl recorre el XML de la hoja sin cargarla entera
+    libro = openpyxl.load_workbook(fuente, read_only=True, data_only=True)
+    try:
+        hoja = libro.active
+        filas = hoja.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else '' for c in next(filas, ())]
+        _columnas_faltantes(encabezado)
+        posiciones = [encabezado.index(c) for c in COLUMNAS_USADAS]
+        total = max((hoja.max_row or 1) - 1, 0)
+        
+        bloque = []
+        for fila in filas:
+            if fila is None or all(v is None for v in fila):
+                continue
+            bloque.append([fila[p] if p < len(fila) else None for p in posiciones])
+            if len(bloque) == tamano_bloque:
+                yield pd.DataFrame(bloque, columns=COLUMNAS_USADAS, dtype=object), total
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=COLUMNAS_USADAS, dtype=object), total
+    finally:
+        libro.close()
+
+
+def _bloques_csv(fuente, tamano_bloque):
+    texto = io.TextIOWrapper(fuente, encoding='utf-8-sig', newline='')
+    muestra = texto.read(64 * 1024)
+    texto.seek(0)
+    try:
+        separador = csv.Sniffer().sniff(muestra, delimiters=',;\t|').delimiter
+    except csv.Error:
+        separador = ','
+    encabezado = next(csv.reader(io.StringIO(muestra), delimiter=separador), [])
+    _columnas_faltantes([c.strip() for c in encabezado])
+    texto.seek(0)
+    
+    lector = pd.read_csv(
+        texto, sep=separador, usecols=lambda c: c.strip() in COLUMNAS_USADAS,
+        dtype=object, chunksize=tamano_bloque
+    )
+    for bloque in lector:
+        bloque.columns = [c.strip() for c in bloque.columns]
+        yield bloque[COLUMNAS_USADAS], None
+
+
+def _bloques_parquet(fuente, tamano_bloque):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ErrorIngesta("Para leer archivos Parquet se necesita instalar pyarrow")
+    
+    archivo = pq.ParquetFile(fuente)
+    _columnas_faltantes(archivo.schema_arrow.names)
+    total = archivo.metadata.num_rows
+    for lote in archivo.iter_batches(batch_size=tamano_bloque, columns=COLUMNAS_USADAS):
+        bloque = lote.to_pandas()
+        # Las fechas tipadas pasan por el mismo parser de texto que Excel y CSV
+        if pd.api.types.is_datetime64_any_dtype(bloque['FechaCreacion']):
+            bloque['FechaCreacion'] = bloque['FechaCreacion'].dt.strftime('%d/%m/%Y %H:%M:%S')
+        yield bloque.astype(object), total
+
+
+def leer_bloques(fuente, nombre, tamano_bloque=TAMANO_BLOQUE):
+    # Genera (bloque, filas_totales) con solo las columnas que usa la aplicación
+    extension = os.path.splitext(nombre or '')[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        return _bloques_excel(fuente, tamano_bloque)
+    if extension == '.csv':
+        return _bloques_csv(fuente, tamano_bloque)
+    if extension == '.parquet':
+        return _bloques_parquet(fuente, tamano_bloque)
+    raise ErrorIngesta(
+        f"Formato no soportado: '{extension or nombre}'. Use {', '.join(FORMATOS_SOPORTADOS)}"
+    )
+
+
+def normalizar_bloque(bloque, alias=None):
+    # Técnicos y coordenadas; descarta las filas sin coordenadas válidas
+    bloque = bloque.copy()
+    bloque['Tecnico_Clean'] = normalizar_tecnicos(bloque[COLUMNA_TECNICO], alias)
+    bloque['Latitud'] = parse_coord_columna(bloque['Latitud'])
+    bloque['Longitud'] = parse_coord_columna(bloque['Longitud'])
+    bloque = bloque.dropna(subset=['Latitud', 'Longitud'])
+    return bloque[(bloque['Latitud'] > 0) & (bloque['Longitud'] < 0)]
+
+
+def fechas_bloque(bloque):
+    fechas, conteo = convertir_fechas_columna(bloque['FechaCreacion'])
+    return bloque.assign(FechaCreacion=fechas), conteo
+
+
+def _unir_bloques(bloques):
+    if not bloques:
+        raise ErrorIngesta("El archivo no contiene filas de datos")
+    tecnicos = union_categoricals([b['Tecnico_Clean'] for b in bloques], sort_categories=True)
+    df = pd.concat([b.drop(columns='Tecnico_Clean') for b in bloques], ignore_index=True)
+    df['Tecnico_Clean'] = pd.Categorical(tecnicos)
+    return df
+
+
+def _a_categoria(serie):
+    # Categórica solo si los valores distintos son pocos frente a las filas
+    if serie.dtype != object:
+        return serie
+    codigos, unicos = pd.factorize(serie)
+    if len(unicos) > PROPORCION_CATEGORIA * len(serie):
+        return serie
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=unicos),
+                     index=serie.index, name=serie.name)
+
+
+def compactar(df):
+    # Esquema final del dataset (ver COLUMNAS_FINALES)
+    df = df[[c for c in COLUMNAS_FINALES if c in df.columns]]
+    cambios = {c: _a_categoria(df[c]) for c in COLUMNAS_CATEGORICAS if c in df.columns}
+    cambios.update({c: df[c].astype(np.float32) for c in COLUMNAS_FLOAT32 if c in df.columns})
+    return df.assign(**cambios)
+
+
+def memoria_columnas(df):
+    return df.memory_usage(index=False, deep=True)
+
+
+def reporte_memoria(antes, despues):
+    # Bytes por columna antes y después de compactar, con una fila de total
+    reporte = pd.DataFrame({'antes': antes, 'despues': despues.reindex(antes.index)})
+    reporte = reporte.fillna(0).astype(np.int64)
+    reporte.loc['Total'] = reporte.sum()
+    return reporte
+
+
+def finalizar(bloques, progreso=_sin_progreso):
+    # Etapas sobre el dataset completo: los duplicados de coordenadas pueden
+    # estar en bloques distintos, así que el ajuste va después de unirlos.
+    # Devuelve también el reporte de memoria de la compactación.
+    df = _unir_bloques(bloques)
+    progreso('ajuste', 0, 1)
+    df = ajustar_coordenadas(df)
+    df['Tecnico_Clean'] = df['Tecnico_Clean'].cat.remove_unused_categories()
+    antes = memoria_columnas(df)
+    df = compactar(df)
+    progreso('ajuste', 1, 1)
+    colores = generar_colores(df['Tecnico_Clean'].cat.categories)
+    return df, colores, reporte_memoria(antes, memoria_columnas(df))
+
+
+def _sumar_conteo(total, conteo):
+    for formato, filas in conteo.items():
+        total[formato] = total.get(formato, 0) + filas
+
+
+def procesar_archivo(fuente, nombre, progreso=_sin_progreso, tamano_bloque=TAMANO_BLOQUE):
+    # Único camino de ingesta: lectura por bloques, limpieza y ajuste.
+    # Devuelve el DataFrame procesado, los colores y un resumen de la carga.
+    alias = cargar_alias()
+    bloques = []
+    resumen = {'archivo': nombre, 'filas_leidas': 0, 'fechas_por_formato': {}}
+    progreso('lectura', 0, None)
+    for bloque, total in leer_bloques(fuente, nombre, tamano_bloque):
+        hechas = resumen['filas_leidas']
+        progreso('normalizacion', hechas, total)
+        limpio = normalizar_bloque(bloque, alias)
+        progreso('fechas', hechas, total)
+        limpio, conteo = fechas_bloque(limpio)
+        _sumar_conteo(resumen['fechas_por_formato'], conteo)
+        bloques.append(limpio)
+        resumen['filas_leidas'] += len(bloque)
+        progreso('lectura', resumen['filas_leidas'], total)
+    
+    df, colores, resumen['memoria'] = finalizar(bloques, progreso)
+    resumen['filas_validas'] = len(df)
+    resumen['filas_descartadas'] = resumen['filas_leidas'] - len(df)
+    resumen['tecnicos'] = len(colores)
+    return df, colores, resumen
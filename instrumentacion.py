@@ -0,0 +1,336 @@
+import contextvars
+import functools
+import glob
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+
+from dash.exceptions import PreventUpdate
+from flask import Response, g, has_request_context, request
+
+# Fracción de llamadas en las que se mide el pico de memoria con tracemalloc.
+# El resto solo paga dos lecturas del reloj y la actualización de contadores.
+# tracemalloc es de todo el proceso: con varios hilos (gthread) la medición
+# incluye lo que reservan otras peticiones al mismo tiempo y las frena
+# mientras dura, así que el pico es aproximado y conviene muestrear poco.
+MUESTREO_MEMORIA = float(os.environ.get('MAPA_MUESTREO_MEMORIA', '0.01'))
+PANEL_DEPURACION = os.environ.get('MAPA_PANEL_DEPURACION', '0') == '1'
+LIMITES_SEGUNDOS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DIRECTORIO_METRICAS = os.environ.get(
+    'MAPA_DIRECTORIO_METRICAS',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metricas')
+)
+
+_filas = contextvars.ContextVar('filas', default=None)
+_traza_memoria = threading.Lock()
+
+
+def registrar_filas(antes, despues):
+    # Lo llaman los callbacks que filtran para informar filas antes y después
+    _filas.set((int(antes), int(despues)))
+
+
+class EstadisticasCallback:
+    def __init__(self):
+        self.llamadas = 0
+        self.errores = 0
+        self.segundos = 0.0
+        self.cubetas = [0] * len(LIMITES_SEGUNDOS)
+        self.bytes_entrada = 0
+        self.bytes_salida = 0
+        self.respuestas = 0
+        self.filas_antes = 0
+        self.filas_despues = 0
+        self.memoria_pico = 0
+
+    def observar(self, segundos):
+        self.llamadas += 1
+        self.segundos += segundos
+        for i, limite in enumerate(LIMITES_SEGUNDOS):
+            if segundos <= limite:
+                self.cubetas[i] += 1
+                break
+
+    def sumar(self, datos):
+        # Acumula los contadores de otro proceso (vars() de otra instancia)
+        for campo, valor in datos.items():
+            if campo == 'cubetas':
+                self.cubetas = [a + b for a, b in zip(self.cubetas, valor)]
+            elif campo == 'memoria_pico':
+                self.memoria_pico = max(self.memoria_pico, valor)
+            elif hasattr(self, campo):
+                setattr(self, campo, getattr(self, campo) + valor)
+
+
+def _sumar_callbacks(total, callbacks):
+    for nombre, datos in callbacks.items():
+        total.setdefault(nombre, EstadisticasCallback()).sumar(datos)
+
+
+def _proceso_vivo(pid):
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class RegistroMetricas:
+    """Contadores de los callbacks, compartidos entre procesos por archivo.
+
+    Cada proceso (los workers de gunicorn y las tareas en segundo plano,
+    como la carga de archivos) guarda los suyos en <directorio>/<pid>.json
+    tras cada observación y /metrics suma los de todos. Los de un proceso
+    terminado los adopta el primero que lee las métricas, para que los
+    contadores no retrocedan ni el directorio crezca sin límite.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_METRICAS):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._pid = None
+
+    def _ruta(self, pid):
+        return os.path.join(self.directorio, f"{pid}.json")
+
+    def _proceso(self):
+        # Un proceso hijo (fork) no cuenta lo heredado del padre; un archivo
+        # con su pid solo puede ser de un proceso anterior ya terminado
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._callbacks = {}
+            self._adoptar(self._ruta(self._pid))
+
+    def _adoptar(self, ruta):
+        # Se renombra antes de leerlo: si dos procesos lo encuentran, solo uno lo suma
+        reclamado = f"{ruta}.{os.getpid()}.adoptado"
+        try:
+            os.replace(ruta, reclamado)
+            with open(reclamado, encoding='utf-8') as archivo:
+                datos = json.load(archivo)
+            os.remove(reclamado)
+        except (OSError, ValueError):
+            return
+        _sumar_callbacks(self._callbacks, datos.get('callbacks', {}))
+
+    def _guardar(self):
+        from almacen import almacen
+        
+        datos = {
+            'callbacks': {nombre: vars(e) for nombre, e in self._callbacks.items()},
+            'almacen': [len(almacen), almacen.bytes_usados],
+        }
+        ruta = self._ruta(self._pid)
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            with open(f"{ruta}.tmp", 'w', encoding='utf-8') as archivo:
+                json.dump(datos, archivo)
+            os.replace(f"{ruta}.tmp", ruta)
+        except OSError:
+            pass  # Las métricas no deben hacer fallar un callback
+
+    def _estadisticas(self, nombre):
+        if nombre not in self._callbacks:
+            self._callbacks[nombre] = EstadisticasCallback()
+        return self._callbacks[nombre]
+
+    def observar(self, nombre, segundos, error=False, filas=None, memoria=None):
+        with self._lock:
+            self._proceso()
+            estadisticas = self._estadisticas(nombre)
+            estadisticas.observar(segundos)
+            estadisticas.errores += int(error)
+            if filas is not None:
+                estadisticas.filas_antes += filas[0]
+                estadisticas.filas_despues += filas[1]
+            if memoria is not None:
+                estadisticas.memoria_pico = max(estadisticas.memoria_pico, memoria)
+            self._guardar()
+
+    def observar_bytes(self, nombre, entrada, salida):
+        with self._lock:
+            self._proceso()
+            estadisticas = self._estadisticas(nombre)
+            estadisticas.bytes_entrada += entrada or 0
+            estadisticas.bytes_salida += salida or 0
+            estadisticas.respuestas += 1
+            self._guardar()
+
+    def agregado(self):
+        # Contadores de todos los procesos y, de los que siguen vivos, los
+        # datasets y bytes de su almacén
+        total = {}
+        memoria = [0, 0]
+        with self._lock:
+            self._proceso()
+            for ruta in glob.glob(os.path.join(self.directorio, '*.json')):
+                nombre = os.path.basename(ruta)[:-len('.json')]
+                if not nombre.isdigit() or int(nombre) == self._pid:
+                    continue
+                if not _proceso_vivo(int(nombre)):
+                    self._adoptar(ruta)
+                    continue
+                try:
+                    with open(ruta, encoding='utf-8') as archivo:
+                        datos = json.load(archivo)
+                except (OSError, ValueError):
+                    continue
+                _sumar_callbacks(total, datos.get('callbacks', {}))
+                memoria = [a + b for a, b in zip(memoria, datos.get('almacen', [0, 0]))]
+            self._guardar()
+            _sumar_callbacks(total, {nombre: vars(e) for nombre, e in self._callbacks.items()})
+        from almacen import almacen
+        memoria = [memoria[0] + len(almacen), memoria[1] + almacen.bytes_usados]
+        return {nombre: vars(e) for nombre, e in total.items()}, memoria
+
+
+registro = RegistroMetricas()
+
+
+def instrumentar(funcion):
+    nombre = funcion.__name__
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if has_request_context():
+            g.callback_instrumentado = nombre
+        token = _filas.set(None)
+        medir_memoria = MUESTREO_MEMORIA > 0 and random.random() < MUESTREO_MEMORIA \
+            and _traza_memoria.acquire(blocking=False)
+        if medir_memoria:
+            tracemalloc.start()
+        error = False
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            memoria = None
+            if medir_memoria:
+                memoria = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                _traza_memoria.release()
+            registro.observar(nombre, segundos, error, _filas.get(), memoria)
+            _filas.reset(token)
+    return envoltura
+
+
+def _medir_respuesta(respuesta):
+    # Tamaño real de la petición y de la respuesta ya serializada del callback
+    nombre = g.get('callback_instrumentado')
+    if nombre is not None and request.path.endswith('_dash-update-component'):
+        registro.observar_bytes(nombre, request.content_length, respuesta.calculate_content_length())
+    return respuesta
+
+
+def _etiqueta(nombre):
+    return nombre.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def texto_prometheus(datos, extra=()):
+    lineas = []
+
+    def metrica(nombre, tipo, ayuda, valores):
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        lineas.extend(valores)
+
+    callbacks = sorted(datos.items())
+    cubetas = []
+    for nombre, e in callbacks:
+        acumulado = 0
+        for limite, cantidad in zip(LIMITES_SEGUNDOS, e['cubetas']):
+            acumulado += cantidad
+            cubetas.append(f'mapa_callback_segundos_bucket{{callback="{_etiqueta(nombre)}",le="{limite}"}} {acumulado}')
+        cubetas.append(f'mapa_callback_segundos_bucket{{callback="{_etiqueta(nombre)}",le="+Inf"}} {e["llamadas"]}')
+        cubetas.append(f'mapa_callback_segundos_sum{{callback="{_etiqueta(nombre)}"}} {e["segundos"]:.6f}')
+        cubetas.append(f'mapa_callback_segundos_count{{callback="{_etiqueta(nombre)}"}} {e["llamadas"]}')
+    metrica('mapa_callback_segundos', 'histogram', 'Duración de los callbacks', cubetas)
+
+    for sufijo, tipo, campo, ayuda in (
+        ('errores_total', 'counter', 'errores', 'Callbacks que terminaron con una excepción'),
+        ('respuestas_total', 'counter', 'respuestas', 'Respuestas HTTP medidas'),
+        ('bytes_entrada_total', 'counter', 'bytes_entrada', 'Bytes recibidos (entradas y estados)'),
+        ('bytes_salida_total', 'counter', 'bytes_salida', 'Bytes enviados (salidas serializadas)'),
+        ('filas_antes_total', 'counter', 'filas_antes', 'Filas del dataset antes de filtrar'),
+        ('filas_despues_total', 'counter', 'filas_despues', 'Filas que quedaron tras filtrar'),
+        ('memoria_pico_bytes', 'gauge', 'memoria_pico', 'Mayor pico de memoria muestreado (aproximado con hilos)'),
+    ):
+        metrica(f'mapa_callback_{sufijo}', tipo, ayuda, [
+            f'mapa_callback_{sufijo}{{callback="{_etiqueta(nombre)}"}} {e[campo]}' for nombre, e in callbacks
+        ])
+
+    for nombre, tipo, ayuda, valor in extra:
+        metrica(nombre, tipo, ayuda, [f"{nombre} {valor}"])
+    return '\n'.join(lineas) + '\n'
+
+
+def metricas_almacen(almacen):
+    # almacen: [datasets, bytes] sumados sobre los procesos vivos
+    return (
+        ('mapa_almacen_datasets', 'gauge', 'Datasets en memoria', almacen[0]),
+        ('mapa_almacen_bytes', 'gauge', 'Bytes ocupados por los datasets en memoria', almacen[1]),
+    )
+
+
+def resumen_callbacks(datos):
+    # Filas para el panel de depuración
+    filas = []
+    for nombre, e in sorted(datos.items()):
+        llamadas = max(e['llamadas'], 1)
+        respuestas = max(e['respuestas'], 1)
+        filas.append({
+            'callback': nombre,
+            'llamadas': e['llamadas'],
+            'errores': e['errores'],
+            'media_ms': round(1000 * e['segundos'] / llamadas, 1),
+            'kb_entrada': round(e['bytes_entrada'] / respuestas / 1024, 1),
+            'kb_salida': round(e['bytes_salida'] / respuestas / 1024, 1),
+            'filas': f"{e['filas_despues'] // llamadas}/{e['filas_antes'] // llamadas}" if e['filas_antes'] else '',
+            'memoria_mb': round(e['memoria_pico'] / 2**20, 1) if e['memoria_pico'] else '',
+        })
+    return filas
+
+
+class AppInstrumentada:
+    """Envuelve la app de Dash para que cada callback registrado quede medido.
+
+    Expone en /metrics del servidor Flask, en formato de texto de Prometheus,
+    las métricas sumadas de todos los procesos (ver RegistroMetricas).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        app.server.after_request(_medir_respuesta)
+        app.server.add_url_rule('/metrics', 'metrics', self.metrics)
+
+    def __getattr__(self, nombre):
+        return getattr(self.app, nombre)
+
+    def callback(self, *args, **kwargs):
+        decorador = self.app.callback(*args, **kwargs)
+        return lambda funcion: decorador(instrumentar(funcion))
+
+    @staticmethod
+    def metrics():
+        callbacks, almacen = registro.agregado()
+        return Response(
+            texto_prometheus(callbacks, metricas_almacen(almacen)),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
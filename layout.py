@@ -1,27 +1,46 @@
-from dash import dcc, html
+from dash import dcc, html, dash_table
 import dash_bootstrap_components as dbc
+from metricas_rutas import COLUMNAS_RESUMEN
+from instrumentacion import PANEL_DEPURACION
+from reproduccion import INTERVALO_MS
 
-def crear_layout():
+def crear_layout(panel_depuracion=PANEL_DEPURACION):
     return html.Div([
         dbc.Container([
             html.H1("Mapa Interactivo de Instalaciones", 
                     className="text-center my-4", 
                     style={'color': '#343a40'}),
             
-            dbc.Card(
+            dbc.Card([
                 dcc.Upload(
                     id='upload-data',
                     children=html.Div([
                         'Arrastra y suelta o ',
-                        html.A('Selecciona un archivo Excel', 
+                        html.A('Selecciona un archivo Excel, CSV o Parquet', 
                                style={'color':'#007bff', 'textDecoration': 'none'})
                     ]),
+                    accept='.xlsx,.xlsm,.csv,.parquet',
                     style=upload_style()
                 ),
-                body=True, className="mb-4 shadow"
-            ),
+                dbc.RadioItems(
+                    id='modo-carga',
+                    options=[
+                        {'label': 'Reemplazar datos', 'value': 'reemplazar'},
+                        {'label': 'Anexar al mapa actual', 'value': 'anexar'}
+                    ],
+                    value='reemplazar',
+                    inline=True,
+                    className="mt-2"
+                )
+            ], body=True, className="mb-4 shadow"),
+            
+            panel_progreso(),
+            html.Div(id='estado-carga', className="mb-4"),
             
             dcc.Store(id='stored-data'),
+            dcc.Store(id='estado-mapa'),
+            dcc.Store(id='horas-por-fecha', data={}),
+            dcc.Store(id='filtro-zona'),
             
             # Mapa en tamaño completo
             dbc.Row(
@@ -34,6 +53,16 @@ def crear_layout():
                 )
             ),
             
+            # Reproducción de las rutas en el tiempo
+            dbc.Row(
+                dbc.Col(controles_reproduccion(), width=12, className="mb-4")
+            ),
+            
+            # Resumen de métricas por técnico y día
+            dbc.Row(
+                dbc.Col(tabla_metricas(), width=12, className="mb-4")
+            ),
+            
             # Sección de controles y detalles debajo del mapa
             dbc.Row([
                 dbc.Col([
@@ -50,10 +79,48 @@ def crear_layout():
                     width=4,
                     style={'height': '50vh', 'overflow-y': 'auto'}  # Panel con scroll
                 )
-            ], className="g-4")  # Espacio entre columnas
+            ], className="g-4"),  # Espacio entre columnas
+            
+            # Tiempos y tamaños por callback (MAPA_PANEL_DEPURACION=1)
+            dbc.Row(
+                dbc.Col(panel_depuracion_callbacks(), width=12, className="mt-4")
+            ) if panel_depuracion else None
         ], fluid=True)
     ], style={'backgroundColor': '#f8f9fa', 'padding': '20px'})
 
+def panel_progreso():
+    # Visible solo mientras una carga corre en segundo plano
+    return html.Div([
+        html.Div(id='etapa-carga', className="mb-1 text-muted"),
+        dbc.Row([
+            dbc.Col(dbc.Progress(id='progreso-carga', value=0, striped=True, animated=True,
+                                 style={'height': '24px'})),
+            dbc.Col(dbc.Button('Cancelar', id='cancelar-carga', color="secondary",
+                               size="sm", disabled=True), width="auto")
+        ], align="center")
+    ], id='panel-progreso', className="mb-3", style={'display': 'none'})
+
+def controles_reproduccion():
+    # Reproduce los puntos filtrados en orden de FechaCreacion; los
+    # fotogramas se calculan al preparar y el navegador los recorre
+    return dbc.Card(
+        dbc.CardBody([
+            dbc.Row([
+                dbc.Col(dbc.Button('Preparar reproducción', id='boton-reproduccion',
+                                   color="outline-primary"), width="auto"),
+                dbc.Col(dbc.Button('Reproducir', id='boton-reproducir', color="primary",
+                                   disabled=True), width="auto"),
+                dbc.Col(dcc.Slider(id='slider-reproduccion', min=0, max=0, step=1, value=0,
+                                   marks=None, updatemode='drag')),
+                dbc.Col(html.Span(id='hora-reproduccion', className="text-muted"), width=2)
+            ], align="center"),
+            dcc.Interval(id='intervalo-reproduccion', interval=INTERVALO_MS, disabled=True),
+            dcc.Store(id='datos-reproduccion'),
+            dcc.Store(id='fotograma-mostrado')
+        ]),
+        className="shadow-sm"
+    )
+
 def upload_style():
     return {
         'width': '100%', 'height': '60px', 'lineHeight': '60px',
@@ -68,7 +135,12 @@ def controles_filtros():
             html.Div([
                 dcc.Dropdown(
                     id='tipo-ruta', 
-                    options=[{'label': 'Rutas individuales', 'value': 'individuales'}],
+                    options=[
+                        {'label': 'Rutas individuales', 'value': 'individuales'},
+                        {'label': 'Rutas en una sola traza', 'value': 'unificadas'},
+                        {'label': 'Ruta real vs. optimizada', 'value': 'optimizadas'},
+                        {'label': 'Mapa de densidad', 'value': 'densidad'}
+                    ],
                     value='individuales',
                     placeholder="Tipo de ruta",
                     className="mb-3"
@@ -93,15 +165,55 @@ def controles_filtros():
                         className="form-control"
                     ),
                 ], className="mb-3"),
+                controles_zona(),
                 dbc.Button('Aplicar Filtros', 
                           id='boton-filtrar', 
                           color="primary", 
-                          className="w-100")
+                          className="w-100"),
+                # Descarga de los puntos y rutas con los filtros actuales
+                dbc.InputGroup([
+                    dbc.Select(
+                        id='formato-exportar',
+                        options=[
+                            {'label': 'GeoJSON', 'value': 'geojson'},
+                            {'label': 'KML (Google Earth)', 'value': 'kml'},
+                            {'label': 'CSV', 'value': 'csv'}
+                        ],
+                        value='geojson'
+                    ),
+                    html.A(
+                        dbc.Button('Exportar', color="secondary"),
+                        id='enlace-exportar',
+                        href='',
+                        target="_blank"
+                    )
+                ], className="mt-3")
             ])
         ]),
         className="shadow-sm"
     )
 
+def controles_zona():
+    # Zona del mapa: radio alrededor del último punto pulsado, o caja/lazo
+    # dibujado con las herramientas de selección del mapa
+    return html.Div([
+        dbc.InputGroup([
+            dbc.Input(
+                id='radio-zona',
+                type='number',
+                min=10,
+                step=10,
+                value=200
+            ),
+            dbc.InputGroupText("m"),
+            dbc.Button('Buscar alrededor del punto', id='boton-zona-radio', color="outline-primary")
+        ], className="mb-2"),
+        html.Div([
+            html.Small("Sin zona", id='descripcion-zona', className="text-muted me-2"),
+            dbc.Button('Quitar zona', id='boton-quitar-zona', color="link", size="sm")
+        ], className="d-flex align-items-center")
+    ], className="mb-3")
+
 def controles_fecha():
     return dbc.Card(
         dbc.CardBody([
@@ -137,4 +249,42 @@ def panel_detalles():
             )
         ]),
         className="shadow-sm h-100"  # Altura completa del contenedor
-    )
\ No newline at end of file
+    )
+
+def tabla_metricas():
+    return dbc.Card(
+        dbc.CardBody([
+            html.H4("Métricas de rutas", className="card-title"),
+            dash_table.DataTable(
+                id='tabla-metricas',
+                columns=[{'name': c, 'id': c} for c in COLUMNAS_RESUMEN],
+                data=[],
+                page_size=10,
+                sort_action='native',
+                style_table={'overflowX': 'auto'},
+                style_cell={'textAlign': 'left', 'padding': '5px'},
+                style_data_conditional=[{
+                    'if': {'filter_query': '{Saltos imposibles} > 0', 'column_id': 'Saltos imposibles'},
+                    'backgroundColor': '#f8d7da'
+                }]
+            )
+        ]),
+        className="shadow-sm"
+    )
+
+def panel_depuracion_callbacks():
+    columnas = ['callback', 'llamadas', 'errores', 'media_ms', 'kb_entrada', 'kb_salida', 'filas', 'memoria_mb']
+    return dbc.Card(
+        dbc.CardBody([
+            html.H4("Depuración: callbacks", className="card-title"),
+            dash_table.DataTable(
+                id='tabla-depuracion',
+                columns=[{'name': c, 'id': c} for c in columnas],
+                data=[],
+                sort_action='native',
+                style_cell={'textAlign': 'left', 'padding': '5px', 'fontFamily': 'monospace'}
+            ),
+            dcc.Interval(id='intervalo-depuracion', interval=5000)
+        ]),
+        className="shadow-sm"
+    )
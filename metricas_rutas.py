@@ -0,0 +1,127 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+RADIO_TIERRA_KM = 6371.0088
+# Por encima de esta velocidad un desplazamiento se considera un salto imposible
+# (normalmente un GPS mal tomado); se ignoran los movimientos muy cortos
+VELOCIDAD_MAXIMA_KMH = 120
+DISTANCIA_MINIMA_SALTO_KM = 0.5
+UMBRAL_INACTIVIDAD_MIN = 60
+COLUMNAS_RESUMEN = [
+    'Técnico', 'Fecha', 'Instalaciones', 'Distancia (km)', 'Tiempo en ruta (h)',
+    'Velocidad media (km/h)', 'Tiempo inactivo (h)', 'Pausas largas', 'Saltos imposibles'
+]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(a))
+
+
+class MetricasRutas:
+    """Métricas de cada ruta técnico-día, calculadas sobre arreglos desplazados.
+
+    Las filas se ordenan por técnico, día y hora; cada fila se compara con la
+    anterior y el par cuenta solo si ambas son del mismo técnico y día.
+    """
+
+    def __init__(self, df):
+        fechas = df['FechaCreacion'].to_numpy(dtype='datetime64[ns]')
+        tecnicos = df['Tecnico_Clean'].cat.codes.to_numpy()
+        validas = np.flatnonzero(~np.isnat(fechas) & (tecnicos >= 0))
+        dias = fechas[validas].astype('datetime64[D]')
+        orden = validas[np.lexsort((fechas[validas], dias, tecnicos[validas]))]
+        
+        tec = tecnicos[orden]
+        dia = fechas[orden].astype('datetime64[D]')
+        hora = fechas[orden]
+        lat = df['Latitud'].to_numpy(dtype=float)[orden]
+        lon = df['Longitud'].to_numpy(dtype=float)[orden]
+        
+        mismo_tramo = (tec[1:] == tec[:-1]) & (dia[1:] == dia[:-1])
+        distancia = np.where(mismo_tramo, haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:]), 0.0)
+        minutos = np.where(mismo_tramo, (hora[1:] - hora[:-1]) / np.timedelta64(1, 'm'), 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            velocidad = np.where(minutos > 0, distancia / (minutos / 60), np.where(distancia > 0, np.inf, 0.0))
+        salto = mismo_tramo & (velocidad > VELOCIDAD_MAXIMA_KMH) & (distancia > DISTANCIA_MINIMA_SALTO_KM)
+        inactivo = mismo_tramo & (minutos > UMBRAL_INACTIVIDAD_MIN)
+        
+        # Velocidad de llegada de las filas que son un salto imposible (NaN en
+        # el resto), para señalarlas en el hover de los puntos
+        self.velocidad_salto = np.full(len(df), np.nan, dtype=np.float32)
+        self.velocidad_salto[orden[1:][salto]] = velocidad[salto]
+        
+        # Resumen por técnico y día con reduceat sobre los inicios de cada tramo
+        if len(orden) == 0:
+            self.resumen = pd.DataFrame(columns=COLUMNAS_RESUMEN)
+            return
+        inicios = np.concatenate(([0], np.flatnonzero(~mismo_tramo) + 1))
+        finales = np.append(inicios[1:], len(orden)) - 1
+        
+        def por_tramo(valores):
+            # valores[i] corresponde al par (i, i+1); se atribuye a la fila i+1
+            return np.add.reduceat(np.concatenate(([0.0], valores)), inicios)
+        
+        distancia_total = por_tramo(distancia)
+        minutos_ruta = (hora[finales] - hora[inicios]) / np.timedelta64(1, 'm')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            velocidad_media = np.where(minutos_ruta > 0, distancia_total / (minutos_ruta / 60), 0.0)
+        categorias = df['Tecnico_Clean'].cat.categories
+        self.resumen = pd.DataFrame({
+            'Técnico': np.asarray(categorias)[tec[inicios]],
+            'Fecha': pd.DatetimeIndex(dia[inicios]).strftime('%d/%m/%Y'),
+            'Instalaciones': finales - inicios + 1,
+            'Distancia (km)': distancia_total.round(2),
+            'Tiempo en ruta (h)': (minutos_ruta / 60).round(2),
+            'Velocidad media (km/h)': velocidad_media.round(1),
+            'Tiempo inactivo (h)': (por_tramo(np.where(inactivo, minutos, 0.0)) / 60).round(2),
+            'Pausas largas': por_tramo(inactivo.astype(float)).astype(int),
+            'Saltos imposibles': por_tramo(salto.astype(float)).astype(int),
+        })
+
+    @property
+    def nbytes(self):
+        return int(self.velocidad_salto.nbytes + self.resumen.memory_usage(deep=True).sum())
+
+    def anexar(self, df_nuevo, df):
+        # df es el dataset combinado, con df_nuevo en sus últimas filas. Solo
+        # se recalculan los técnico-día que tocan las filas nuevas, con todas
+        # sus filas: una instalación intercalada cambia la ruta de ese día
+        fechas = df['FechaCreacion'].to_numpy(dtype='datetime64[ns]')
+        tecnicos = df['Tecnico_Clean'].cat.codes.to_numpy().astype(np.int64)
+        dias = fechas.astype('datetime64[D]').view(np.int64)
+        claves = np.where(np.isnat(fechas) | (tecnicos < 0), -1, (tecnicos << 32) | (dias & 0xFFFFFFFF))
+        previas = len(self.velocidad_salto)
+        tocadas = np.unique(claves[previas:])
+        filas = np.flatnonzero(np.isin(claves, tocadas[tocadas >= 0]))
+        parcial = MetricasRutas(df.iloc[filas])
+        
+        nuevo = copy.copy(self)
+        nuevo.velocidad_salto = np.concatenate([
+            self.velocidad_salto, np.full(len(df) - previas, np.nan, dtype=np.float32)
+        ])
+        nuevo.velocidad_salto[filas] = parcial.velocidad_salto
+        
+        pares = ['Técnico', 'Fecha']
+        vigentes = ~pd.MultiIndex.from_frame(self.resumen[pares]).isin(
+            pd.MultiIndex.from_frame(parcial.resumen[pares]))
+        resumen = pd.concat([self.resumen[vigentes], parcial.resumen], ignore_index=True)
+        dia = pd.to_datetime(resumen['Fecha'], format='%d/%m/%Y').to_numpy()
+        nuevo.resumen = resumen.iloc[np.lexsort((dia, resumen['Técnico'].to_numpy()))].reset_index(drop=True)
+        return nuevo
+
+    def resumen_filtrado(self, tecnicos=None, fecha=None):
+        resumen = self.resumen
+        if tecnicos:
+            resumen = resumen[resumen['Técnico'].isin(tecnicos)]
+        if fecha:
+            resumen = resumen[resumen['Fecha'] == fecha]
+        return resumen
+
+
+def obtener_metricas(conjunto):
+    return conjunto.derivado('metricas', MetricasRutas)
@@ -0,0 +1,180 @@
+import copy
+
+import numpy as np
+
+# Nivel de detalle del mapa: por debajo de ZOOM_DETALLE y con más de
+# UMBRAL_PUNTOS filas se envían grupos por celda de rejilla en lugar de puntos
+ZOOM_DETALLE = 14
+UMBRAL_PUNTOS = 5000
+PIXELES_CELDA = 64
+_TAMANO_TESELA = 256
+
+
+def _pixeles(lat, lon, zoom):
+    # Coordenadas de píxel Web Mercator, las mismas que usa el mapa
+    escala = _TAMANO_TESELA * 2 ** zoom
+    lat = np.clip(lat, -85.05, 85.05)
+    x = (lon + 180.0) / 360.0 * escala
+    seno = np.sin(np.radians(lat))
+    y = (0.5 - np.log((1 + seno) / (1 - seno)) / (4 * np.pi)) * escala
+    return x, y
+
+
+class RejillaNiveles:
+    """Agrupación por celdas para cada zoom, calculada al cargar el dataset.
+
+    Se guarda la celda de cada fila en el zoom de detalle; la celda en un
+    zoom menor se obtiene desplazando bits, porque cada nivel duplica el
+    tamaño de la celda. Los grupos del dataset completo quedan precalculados
+    por zoom y los de un subconjunto filtrado se agregan con bincount.
+    """
+
+    def __init__(self, df):
+        self.lat = df['Latitud_adj'].to_numpy(dtype=float)
+        self.lon = df['Longitud_adj'].to_numpy(dtype=float)
+        x, y = _pixeles(self.lat, self.lon, ZOOM_DETALLE)
+        self.celda_x = (x // PIXELES_CELDA).astype(np.int64)
+        self.celda_y = (y // PIXELES_CELDA).astype(np.int64)
+        self.completo = {
+            zoom: self._agrupar(None, zoom) for zoom in range(ZOOM_DETALLE)
+        }
+
+    @property
+    def nbytes(self):
+        total = self.lat.nbytes + self.lon.nbytes + self.celda_x.nbytes + self.celda_y.nbytes
+        for grupos in self.completo.values():
+            total += sum(arreglo.nbytes for arreglo in grupos)
+        return int(total)
+
+    def _agrupar(self, posiciones, zoom):
+        desplazamiento = ZOOM_DETALLE - zoom
+        if posiciones is None:
+            cx, cy, lat, lon = self.celda_x, self.celda_y, self.lat, self.lon
+        else:
+            cx, cy = self.celda_x[posiciones], self.celda_y[posiciones]
+            lat, lon = self.lat[posiciones], self.lon[posiciones]
+        if zoom > ZOOM_DETALLE:
+            # Más fino que el zoom de detalle: celdas a partir de las coordenadas
+            x, y = _pixeles(lat, lon, zoom)
+            cx, cy = (x // PIXELES_CELDA).astype(np.int64), (y // PIXELES_CELDA).astype(np.int64)
+            desplazamiento = 0
+        if len(lat) == 0:
+            vacio = np.array([], dtype=float)
+            return np.array([], dtype=np.int64), vacio, vacio, np.array([], dtype=np.int64)
+        claves = ((cx >> desplazamiento) << 32) | (cy >> desplazamiento)
+        claves, inversa = np.unique(claves, return_inverse=True)
+        conteo = np.bincount(inversa)
+        lat_centro = np.bincount(inversa, weights=lat) / conteo
+        lon_centro = np.bincount(inversa, weights=lon) / conteo
+        return claves, lat_centro, lon_centro, conteo
+
+    def anexar(self, df_nuevo):
+        # Rejilla con df_nuevo al final. La celda de una fila no depende del
+        # resto (la rejilla Web Mercator es fija), así que solo se agrupan las
+        # filas nuevas y sus grupos se suman a los precalculados
+        nuevo = copy.copy(self)
+        agregado = RejillaNiveles(df_nuevo)
+        for atributo in ('lat', 'lon', 'celda_x', 'celda_y'):
+            setattr(nuevo, atributo, np.concatenate([getattr(self, atributo), getattr(agregado, atributo)]))
+        nuevo.completo = {
+            zoom: _sumar_grupos(self.completo[zoom], agregado.completo[zoom]) for zoom in self.completo
+        }
+        return nuevo
+
+    def grupos(self, zoom, posiciones=None, vista=None):
+        # Devuelve (lat, lon, conteo) de los grupos visibles en la vista. Desde
+        # el zoom de detalle (lo usa la densidad) no hay grupos precalculados
+        # y solo se agrupan las filas visibles
+        zoom = int(max(np.floor(zoom), 0))
+        if (posiciones is None or len(posiciones) == len(self.lat)) and zoom in self.completo:
+            _, lat, lon, conteo = self.completo[zoom]
+        else:
+            if zoom >= ZOOM_DETALLE and vista is not None:
+                filas = np.arange(len(self.lat)) if posiciones is None else posiciones
+                posiciones = filas[en_vista(self.lat[filas], self.lon[filas], vista)]
+            _, lat, lon, conteo = self._agrupar(posiciones, zoom)
+        if vista is not None:
+            dentro = en_vista(lat, lon, vista)
+            lat, lon, conteo = lat[dentro], lon[dentro], conteo[dentro]
+        return lat, lon, conteo
+
+
+def _sumar_grupos(previos, nuevos):
+    # Une dos agrupaciones (claves ordenadas, centros y conteos) del mismo
+    # zoom: los centros de una celda compartida se promedian por conteo
+    claves, lat, lon, conteo = previos
+    claves_n, lat_n, lon_n, conteo_n = nuevos
+    posiciones = np.minimum(np.searchsorted(claves, claves_n), max(len(claves) - 1, 0))
+    existe = (claves[posiciones] == claves_n) if len(claves) else np.zeros(len(claves_n), dtype=bool)
+    p = posiciones[existe]
+    total = conteo[p] + conteo_n[existe]
+    lat, lon, conteo = lat.copy(), lon.copy(), conteo.copy()
+    lat[p] = (lat[p] * conteo[p] + lat_n[existe] * conteo_n[existe]) / total
+    lon[p] = (lon[p] * conteo[p] + lon_n[existe] * conteo_n[existe]) / total
+    conteo[p] = total
+    insertar = np.searchsorted(claves, claves_n[~existe])
+    return (np.insert(claves, insertar, claves_n[~existe]), np.insert(lat, insertar, lat_n[~existe]),
+            np.insert(lon, insertar, lon_n[~existe]), np.insert(conteo, insertar, conteo_n[~existe]))
+
+
+def _limites(vista, margen):
+    alto = (vista['lat_max'] - vista['lat_min']) * margen
+    ancho = (vista['lon_max'] - vista['lon_min']) * margen
+    return (vista['lat_min'] - alto, vista['lat_max'] + alto,
+            vista['lon_min'] - ancho, vista['lon_max'] + ancho)
+
+
+def en_vista(lat, lon, vista, margen=0.1):
+    # Máscara de coordenadas dentro de los límites visibles, con un margen
+    # para que un desplazamiento corto no deje el borde vacío
+    lat_min, lat_max, lon_min, lon_max = _limites(vista, margen)
+    return (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+
+
+def tramos_en_vista(lat1, lon1, lat2, lon2, vista, margen=0.1):
+    # Segmentos que pasan por los límites visibles, aunque ninguno de sus
+    # extremos quede dentro (recorte de Liang-Barsky sobre cada eje)
+    lat_min, lat_max, lon_min, lon_max = _limites(vista, margen)
+    entrada = np.zeros(len(lat1))
+    salida = np.ones(len(lat1))
+    for origen, fin, minimo, maximo in ((lat1, lat2, lat_min, lat_max), (lon1, lon2, lon_min, lon_max)):
+        delta = fin - origen
+        dentro = (origen >= minimo) & (origen <= maximo)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_min, t_max = (minimo - origen) / delta, (maximo - origen) / delta
+        # Sin avance en el eje: pasa entero si el origen está dentro
+        entrada = np.maximum(entrada, np.where(delta == 0, np.where(dentro, -np.inf, np.inf),
+                                               np.minimum(t_min, t_max)))
+        salida = np.minimum(salida, np.where(delta == 0, np.inf, np.maximum(t_min, t_max)))
+    return entrada <= salida
+
+
+def leer_vista(relayout_data):
+    # Convierte relayoutData del mapa en zoom y límites visibles
+    if not relayout_data or 'mapbox.zoom' not in relayout_data:
+        return None
+    vista = {'zoom': float(relayout_data['mapbox.zoom'])}
+    centro = relayout_data.get('mapbox.center') or {}
+    esquinas = (relayout_data.get('mapbox._derived') or {}).get('coordinates')
+    if esquinas:
+        lons = [p[0] for p in esquinas]
+        lats = [p[1] for p in esquinas]
+    elif centro:
+        return limites_centro({'zoom': vista['zoom'], 'lat': centro['lat'], 'lon': centro['lon']})
+    else:
+        return None
+    vista.update(lat_min=min(lats), lat_max=max(lats), lon_min=min(lons), lon_max=max(lons))
+    vista['lat'] = centro.get('lat', (vista['lat_min'] + vista['lat_max']) / 2)
+    vista['lon'] = centro.get('lon', (vista['lon_min'] + vista['lon_max']) / 2)
+    return vista
+
+
+def limites_centro(vista):
+    # Sin límites derivados: aproximación a partir del centro y el zoom
+    medio = 360.0 / 2 ** vista['zoom']
+    return dict(vista, lat_min=vista['lat'] - medio / 2, lat_max=vista['lat'] + medio / 2,
+                lon_min=vista['lon'] - medio, lon_max=vista['lon'] + medio)
+
+
+def obtener_rejilla(conjunto):
+    return conjunto.derivado('rejilla', RejillaNiveles)
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+from metricas_rutas import haversine_km
+
+# Tiempo máximo de un análisis completo; lo que no termine a tiempo se
+# informa como pendiente y se completa en la siguiente consulta
+PRESUPUESTO_S = float(os.environ.get('MAPA_PRESUPUESTO_OPTIMIZACION_S', '5'))
+MIN_PUNTOS = 4
+# Procesos para la optimización; con varios workers de gunicorn conviene repartirlos
+PROCESOS = int(os.environ.get('MAPA_PROCESOS_OPTIMIZACION', max((os.cpu_count() or 2) - 1, 1)))
+# Memoria por dataset para las rutas ya optimizadas; al llenarse se
+# descartan las menos usadas
+LIMITE_RUTAS_MB = float(os.environ.get('MAPA_LIMITE_RUTAS_OPTIMIZADAS_MB', '16'))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def matriz_distancias(lat, lon):
+    return haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+
+def longitud_ruta(ruta, distancias):
+    return float(distancias[ruta[:-1], ruta[1:]].sum())
+
+
+def vecino_mas_cercano(distancias, inicio=0):
+    n = len(distancias)
+    ruta = np.empty(n, dtype=np.int64)
+    visitado = np.zeros(n, dtype=bool)
+    actual = inicio
+    for paso in range(n):
+        ruta[paso] = actual
+        visitado[actual] = True
+        if paso < n - 1:
+            candidatos = np.where(visitado, np.inf, distancias[actual])
+            actual = int(np.argmin(candidatos))
+    return ruta
+
+
+def dos_opt(ruta, distancias, limite):
+    # 2-opt para ruta abierta con el primer punto fijo: para cada i se evalúan
+    # todos los j a la vez y se aplica la inversión que más acorta. Devuelve
+    # la ruta y si terminó (sin mejoras pendientes) antes del límite.
+    ruta = ruta.copy()
+    n = len(ruta)
+    mejora = True
+    while mejora and time.time() < limite:
+        mejora = False
+        for i in range(1, n - 1):
+            a, b = ruta[i - 1], ruta[i]
+            j = np.arange(i + 1, n)
+            c = ruta[j]
+            delta = distancias[a, c] - distancias[a, b]
+            interior = j < n - 1
+            d = ruta[j[interior] + 1]
+            delta[interior] += distancias[b, d] - distancias[c[interior], d]
+            mejor = int(np.argmin(delta))
+            if delta[mejor] < -1e-9:
+                k = j[mejor]
+                ruta[i:k + 1] = ruta[i:k + 1][::-1]
+                mejora = True
+            if time.time() >= limite:
+                break
+    return ruta, not mejora
+
+
+def optimizar_tramo(tarea):
+    # Se ejecuta en el pool de procesos: recibe solo arreglos y devuelve
+    # el orden optimizado con la distancia real y la optimizada, y si el
+    # 2-opt terminó o lo cortó el límite de tiempo
+    clave, lat, lon, limite = tarea
+    distancias = matriz_distancias(lat, lon)
+    real = longitud_ruta(np.arange(len(lat)), distancias)
+    ruta, completo = dos_opt(vecino_mas_cercano(distancias), distancias, limite)
+    optima = longitud_ruta(ruta, distancias)
+    if optima > real:
+        ruta, optima = np.arange(len(lat)), real
+    return clave, ruta, real, optima, completo
+
+
+def _obtener_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PROCESOS)
+        return _executor
+
+
+class RutasOptimizadas:
+    """Rutas terminadas por firma de técnico-día, con expulsión LRU por bytes.
+
+    Su tamaño en el almacén es el límite completo, así el dataset cuenta
+    desde el principio la memoria que la caché puede llegar a ocupar.
+    """
+
+    def __init__(self, limite_bytes=LIMITE_RUTAS_MB * 1024 * 1024):
+        self.limite_bytes = int(limite_bytes)
+        self._rutas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.limite_bytes
+
+    def get(self, firma):
+        with self._lock:
+            resultado = self._rutas.get(firma)
+            if resultado is not None:
+                self._rutas.move_to_end(firma)
+            return resultado
+
+    def guardar(self, firma, resultado):
+        with self._lock:
+            if firma in self._rutas:
+                return
+            self._rutas[firma] = resultado
+            self._bytes += resultado[0].nbytes
+            while self._bytes > self.limite_bytes and len(self._rutas) > 1:
+                _, (ruta, _, _) = self._rutas.popitem(last=False)
+                self._bytes -= ruta.nbytes
+
+
+def tramos(df):
+    # Índices de cada técnico-día en df, ya ordenado por técnico y fecha
+    if len(df) == 0:
+        return []
+    tecnicos = df['Tecnico_Clean'].cat.codes.to_numpy()
+    dias = df['FechaCreacion'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    cortes = np.flatnonzero((tecnicos[1:] != tecnicos[:-1]) | (dias[1:] != dias[:-1])) + 1
+    inicios = np.concatenate(([0], cortes))
+    finales = np.append(cortes, len(df))
+    return [
+        ((df['Tecnico_Clean'].iat[i], str(dias[i])), i, f)
+        for i, f in zip(inicios, finales)
+        if not np.isnat(dias[i])
+    ]
+
+
+def analizar(conjunto, df, presupuesto=PRESUPUESTO_S):
+    """Optimiza el orden de visita de cada técnico-día presente en df.
+
+    Las rutas terminadas se guardan en el dataset, de modo que cada
+    técnico-día se resuelve una sola vez; las que cortó el presupuesto se
+    muestran como están y se retoman en la siguiente consulta. Devuelve
+    {clave: (posiciones_df, ruta, real, optima)} y la cantidad de técnico-días
+    sin terminar o sin resolver por tiempo.
+    """
+    cache = conjunto.derivado('optimizacion', lambda df: RutasOptimizadas())
+    lat = df['Latitud'].to_numpy(dtype=float)
+    lon = df['Longitud'].to_numpy(dtype=float)
+    limite = time.time() + presupuesto
+    
+    def firma(clave, inicio, fin):
+        # Un mismo técnico-día puede llegar con distintos puntos según los filtros
+        return clave, hash((lat[inicio:fin].tobytes(), lon[inicio:fin].tobytes()))
+    
+    segmentos = [t for t in tramos(df) if t[2] - t[1] >= MIN_PUNTOS]
+    pendientes = {}
+    parciales = {}
+    for clave, inicio, fin in segmentos:
+        if cache.get(firma(clave, inicio, fin)) is None:
+            pendientes[firma(clave, inicio, fin)] = (clave, lat[inicio:fin], lon[inicio:fin], limite)
+    
+    if pendientes:
+        executor = _obtener_executor()
+        futuros = {executor.submit(optimizar_tramo, tarea): f for f, tarea in pendientes.items()}
+        hechos, no_hechos = wait(futuros, timeout=max(limite - time.time(), 0) + 1)
+        for futuro in no_hechos:
+            futuro.cancel()
+        for futuro in hechos:
+            _, ruta, real, optima, completo = futuro.result()
+            if completo:
+                cache.guardar(futuros[futuro], (ruta, real, optima))
+            else:
+                parciales[futuros[futuro]] = (ruta, real, optima)
+        sin_resolver = len(no_hechos) + len(parciales)
+    else:
+        sin_resolver = 0
+    
+    resultados = {}
+    for clave, inicio, fin in segmentos:
+        resultado = cache.get(firma(clave, inicio, fin)) or parciales.get(firma(clave, inicio, fin))
+        if resultado is not None:
+            resultados[clave] = (np.arange(inicio, fin),) + resultado
+    return resultados, sin_resolver
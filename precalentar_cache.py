@@ -0,0 +1,65 @@
+import argparse
+import os
+import sys
+import time
+
+from almacen import calcular_clave
+from cache_disco import CacheDisco
+from ingesta import FORMATOS_SOPORTADOS, procesar_archivo
+
+
+def buscar_archivos(directorio, recursivo):
+    for raiz, carpetas, archivos in os.walk(directorio):
+        for nombre in sorted(archivos):
+            if nombre.startswith('~$'):
+                continue  # Archivos de bloqueo de Excel
+            if os.path.splitext(nombre)[1].lower() in FORMATOS_SOPORTADOS:
+                yield os.path.join(raiz, nombre)
+        if not recursivo:
+            break
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Procesa los archivos de un directorio y los deja en la caché en disco."
+    )
+    parser.add_argument('directorio', help="Directorio con los archivos Excel, CSV o Parquet")
+    parser.add_argument('-r', '--recursivo', action='store_true', help="Incluir subdirectorios")
+    parser.add_argument('-f', '--forzar', action='store_true',
+                        help="Reprocesar aunque el archivo ya esté en la caché")
+    parser.add_argument('--cache', default=None, help="Directorio de la caché (por defecto el de la aplicación)")
+    args = parser.parse_args(argv)
+    
+    cache = CacheDisco(args.cache) if args.cache else CacheDisco()
+    procesados = omitidos = fallidos = 0
+    for ruta in buscar_archivos(args.directorio, args.recursivo):
+        with open(ruta, 'rb') as archivo:
+            contenido = archivo.read()
+        clave = calcular_clave(contenido)
+        if cache.existe(clave) and not args.forzar:
+            omitidos += 1
+            print(f"= {ruta} (ya en caché)")
+            continue
+        
+        inicio = time.perf_counter()
+        try:
+            with open(ruta, 'rb') as archivo:
+                df, colores, resumen = procesar_archivo(archivo, os.path.basename(ruta))
+            if args.forzar:
+                cache.eliminar(clave)
+            cache.guardar(clave, df, colores)
+        except Exception as e:
+            fallidos += 1
+            print(f"! {ruta}: {e}", file=sys.stderr)
+            continue
+        procesados += 1
+        megas = resumen['memoria'].loc['Total', 'despues'] / 2**20
+        print(f"+ {ruta}: {resumen['filas_validas']} filas en {time.perf_counter() - inicio:.1f} s, "
+              f"{megas:.1f} MB en memoria")
+    
+    print(f"{procesados} procesados, {omitidos} ya en caché, {fallidos} con error")
+    return 1 if fallidos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from figuras import datos_detalle, marcador_por_tecnico, texto_hover, trazas_reproduccion
+
+# Fotogramas: como máximo MAX_FOTOGRAMAS, separados al menos PASO_MINIMO.
+# Por encima de MAX_PUNTOS la reproducción pide acotar los filtros.
+MAX_FOTOGRAMAS = 240
+PASO_MINIMO = pd.Timedelta(minutes=5)
+MAX_PUNTOS = 20000
+MAX_MARCAS = 12
+INTERVALO_MS = 400
+
+
+def paso_fotogramas(duracion):
+    # Paso en minutos enteros, el menor que no supere MAX_FOTOGRAMAS
+    paso = max(PASO_MINIMO, duracion / (MAX_FOTOGRAMAS - 1))
+    return pd.Timedelta(minutes=int(np.ceil(paso / pd.Timedelta(minutes=1))))
+
+
+def preparar_reproduccion(df, posiciones, colores, saltos=None):
+    """Fotogramas acumulados para reproducir las rutas en el tiempo.
+
+    Los puntos se ordenan una vez por FechaCreacion; el fotograma k muestra
+    los primeros limites[k] puntos, así que pasar de un fotograma al
+    siguiente solo agrega el tramo limites[k-1]:limites[k]. Devuelve las
+    trazas vacías de la figura y los datos que el navegador usa para
+    extenderlas (assets/callbacks.js), o None si no hay puntos con fecha.
+    saltos es la velocidad de llegada por fila de df que marca los saltos
+    imposibles en el hover (MetricasRutas.velocidad_salto).
+    """
+    fechas = df['FechaCreacion'].to_numpy(dtype='datetime64[ns]')[posiciones]
+    posiciones = posiciones[~np.isnat(fechas)]
+    if len(posiciones) == 0:
+        return None
+    orden = np.argsort(fechas[~np.isnat(fechas)], kind='stable')
+    puntos = df.take(posiciones[orden])
+    puntos['Secuencia'] = puntos.groupby('Tecnico_Clean', observed=True).cumcount() + 1
+    fechas = puntos['FechaCreacion'].to_numpy(dtype='datetime64[ns]')
+    
+    # Cada técnico presente tiene su traza de línea (1..n); la 0 son los puntos
+    codigos = puntos['Tecnico_Clean'].cat.codes.to_numpy()
+    presentes, traza = np.unique(codigos, return_inverse=True)
+    categorias = puntos['Tecnico_Clean'].cat.categories
+    tecnicos = [categorias[c] if c >= 0 else '' for c in presentes]
+    
+    inicio = pd.Timestamp(fechas[0]).floor('min')
+    paso = paso_fotogramas(pd.Timestamp(fechas[-1]) - inicio)
+    total = int(np.ceil((pd.Timestamp(fechas[-1]) - inicio) / paso)) + 1
+    tiempos = pd.DatetimeIndex(inicio + paso * np.arange(total))
+    limites = np.searchsorted(fechas, tiempos.to_numpy(), side='right')
+    
+    # Marcas del slider en los cambios de hora (o de día si son muchas)
+    formato = '%H:%M' if tiempos[-1].normalize() == tiempos[0].normalize() else '%d/%m %H:%M'
+    etiquetas = tiempos.strftime(formato)
+    cambios = np.flatnonzero(np.r_[True, tiempos.floor('h')[1:] != tiempos.floor('h')[:-1]])
+    if len(cambios) > MAX_MARCAS:
+        cambios = cambios[::int(np.ceil(len(cambios) / MAX_MARCAS))]
+    
+    datos = {
+        'lat': np.round(puntos['Latitud_adj'].to_numpy(dtype=float), 6),
+        'lon': np.round(puntos['Longitud_adj'].to_numpy(dtype=float), 6),
+        'traza': traza + 1,
+        'color': marcador_por_tecnico(puntos, colores)['color'],
+        'texto': puntos['Secuencia'].to_numpy(),
+        'hovertext': texto_hover(puntos, None if saltos is None else saltos[posiciones[orden]]),
+        'customdata': datos_detalle(puntos),
+        'limites': limites,
+        'etiquetas': np.asarray(etiquetas, dtype=object),
+    }
+    marcas = {int(i): etiquetas[i] for i in cambios}
+    return trazas_reproduccion(puntos, tecnicos, colores), datos, marcas
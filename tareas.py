@@ -0,0 +1,20 @@
+import os
+
+# Cola local de tareas en segundo plano: diskcache guarda en disco el estado,
+# el progreso y el resultado de cada tarea, así que la ven todos los workers
+# sin necesidad de un broker externo.
+DIRECTORIO_TAREAS = os.environ.get(
+    'MAPA_DIRECTORIO_TAREAS',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_tareas')
+)
+
+
+def gestor_tareas(directorio=DIRECTORIO_TAREAS):
+    # Requiere dash[diskcache] (diskcache, multiprocess, psutil); sin él los
+    # callbacks en segundo plano corren dentro de la petición
+    try:
+        import diskcache
+        from dash import DiskcacheManager
+        return DiskcacheManager(diskcache.Cache(directorio))
+    except ImportError:
+        return None
@@ -0,0 +1,25 @@
+import io
+import os
+import tempfile
+
+import pytest
+
+# Caché y métricas de las pruebas fuera del repositorio; se fijan antes de
+# importar los módulos que leen estas variables
+_temporal = tempfile.mkdtemp(prefix='mapa-pruebas-')
+os.environ.setdefault('MAPA_DIRECTORIO_CACHE', os.path.join(_temporal, 'cache'))
+os.environ.setdefault('MAPA_DIRECTORIO_METRICAS', os.path.join(_temporal, 'metricas'))
+
+from benchmarks.generador import generar_instalaciones
+from ingesta import COLUMNAS_USADAS, procesar_archivo
+
+
+@pytest.fixture(scope='session')
+def dataset():
+    # Dataset procesado pequeño, por el mismo camino que una carga de archivo
+    crudo = generar_instalaciones(2000, 5, 0.2, 0.3, 0.5, semilla=1)
+    buffer = io.BytesIO()
+    crudo[COLUMNAS_USADAS].to_csv(buffer, index=False)
+    buffer.seek(0)
+    df, colores, _ = procesar_archivo(buffer, 'prueba.csv')
+    return df, colores
@@ -0,0 +1,22 @@
+import pytest
+
+from almacen import AlmacenDatos, calcular_clave
+from cache_disco import CacheDisco
+
+
+@pytest.mark.parametrize('clave', ['/tmp/cache/x', '../cache_datos', 'ABC', calcular_clave(b'x') + '/..', None])
+def test_clave_invalida(tmp_path, clave):
+    cache = CacheDisco(str(tmp_path))
+    almacen = AlmacenDatos(respaldo=cache)
+    assert almacen.obtener(clave) is None
+    assert clave not in almacen
+    with pytest.raises(ValueError):
+        cache.ruta(clave)
+
+
+def test_ida_vuelta(tmp_path, dataset):
+    df, colores = dataset
+    clave = calcular_clave(b'ida-vuelta')
+    AlmacenDatos(respaldo=CacheDisco(str(tmp_path))).guardar(clave, df, colores)
+    conjunto = AlmacenDatos(respaldo=CacheDisco(str(tmp_path))).obtener(clave)
+    assert conjunto.df.equals(df)
@@ -0,0 +1,59 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utilities import convertir_fechas, convertir_fechas_columna
+
+# Valores de FechaCreacion como llegan de Excel, CSV y Parquet
+CORPUS = [
+    '05/01/2024 08:15:00',
+    '5/1/2024 8:15:00',
+    '31/12/2023 23:59:59',
+    '05/01/2024 08:15:00 a. m.',
+    '05/01/2024 12:30:00 p. m.',
+    '05/01/2024 12:30:00 a. m.',
+    '05/01/2024 01:05:09 P. M.',
+    '  05/01/2024 08:15:00 am  ',
+    '05/01/2024 08:15:00 pm',
+    '05/01/2024',
+    '2024-01-05 08:15:00',
+    '2024-01-05',
+    '2024/01/05 08:15:00',
+    datetime.datetime(2024, 1, 5, 8, 15),
+    pd.Timestamp('2024-01-05 08:15:00'),
+    45296.34375,
+    45296,
+    '45296.34375',
+    '',
+    '   ',
+    'sin fecha',
+    '31/02/2024 08:15:00',
+    '05/13/2024 08:15:00',
+    '05/01/2024 25:00:00',
+    '05/01/2024 13:00:00 p. m.',
+    None,
+    np.nan,
+]
+
+
+def _igual(a, b):
+    return (pd.isna(a) and pd.isna(b)) or a == b
+
+
+@pytest.mark.parametrize('valor', CORPUS, ids=[repr(v) for v in CORPUS])
+def test_misma_fecha_que_convertir_fechas(valor):
+    fechas, _ = convertir_fechas_columna(pd.Series([valor], dtype=object))
+    assert _igual(fechas.iloc[0], convertir_fechas(valor))
+
+
+def test_columna_completa():
+    # Valores repetidos y mezclados, como en una columna real
+    serie = pd.Series(CORPUS * 3, dtype=object, index=np.arange(len(CORPUS) * 3) + 10)
+    fechas, conteo = convertir_fechas_columna(serie)
+    esperadas = serie.apply(convertir_fechas)
+    assert fechas.index.equals(serie.index)
+    assert all(_igual(a, b) for a, b in zip(fechas, esperadas))
+    assert sum(conteo.values()) == len(serie)
+    assert conteo['sin_formato'] == int(esperadas.isna().sum())
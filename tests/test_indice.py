@@ -0,0 +1,34 @@
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from indice import MAX_CONSULTAS_CACHE, ColumnaTexto
+
+
+def _columna():
+    return ColumnaTexto(pd.Series([f"N{i % 500}" for i in range(5000)], dtype=object))
+
+
+def test_consultas_concurrentes():
+    columna = _columna()
+    nbytes = columna.nbytes
+    patrones = [f"N{i}" for i in range(3 * MAX_CONSULTAS_CACHE)] * 4
+    with ThreadPoolExecutor(max_workers=8) as hilos:
+        resultados = list(hilos.map(columna.contiene, patrones))
+    texto = columna.unicos.to_numpy()[columna.codigos]
+    for patron, bits in zip(patrones, resultados):
+        esperado = pd.Series(texto).str.contains(patron).to_numpy()
+        assert np.array_equal(np.unpackbits(bits, count=len(texto)).view(bool), esperado)
+    assert len(columna._consultas) <= MAX_CONSULTAS_CACHE
+    # La caché está contada desde el principio
+    assert columna.nbytes == nbytes
+
+
+def test_pickle_sin_cache():
+    columna = _columna()
+    columna.contiene('N1')
+    copia = pickle.loads(pickle.dumps(columna))
+    assert len(copia._consultas) == 0
+    assert np.array_equal(copia.contiene('N1'), columna.contiene('N1'))
@@ -0,0 +1,33 @@
+import multiprocessing
+import os
+
+import pytest
+
+from instrumentacion import RegistroMetricas
+
+
+def _observar(registro, veces):
+    for _ in range(veces):
+        registro.observar('cargar', 0.02)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="requiere fork")
+def test_metricas_de_varios_procesos(tmp_path):
+    registro = RegistroMetricas(str(tmp_path))
+    registro.observar('cargar', 0.02)
+    registro.observar_bytes('cargar', 100, 2000)
+    
+    # Procesos hijos como las tareas en segundo plano: no cuentan lo heredado
+    contexto = multiprocessing.get_context('fork')
+    for veces in (2, 3):
+        hijo = contexto.Process(target=_observar, args=(registro, veces))
+        hijo.start()
+        hijo.join()
+    
+    callbacks, _ = registro.agregado()
+    assert callbacks['cargar']['llamadas'] == 6
+    assert callbacks['cargar']['bytes_salida'] == 2000
+    assert sum(callbacks['cargar']['cubetas']) == 6
+    # Los archivos de los procesos terminados quedan adoptados por este
+    assert os.listdir(tmp_path) == [f"{os.getpid()}.json"]
+    assert registro.agregado()[0]['cargar']['llamadas'] == 6
@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+import pytest
+from dash import Dash
+
+from almacen import ConjuntoDatos, almacen, calcular_clave
+from benchmarks.ejecutar import peticion_mapa
+from callbacks import registrar_callbacks
+from layout import crear_layout
+from optimizacion_rutas import RutasOptimizadas, analizar, optimizar_tramo, tramos
+
+
+def test_tramos_sin_filas(dataset):
+    df, _ = dataset
+    assert tramos(df.iloc[:0]) == []
+
+
+def test_analizar_sin_filas(dataset):
+    df, colores = dataset
+    conjunto = ConjuntoDatos(calcular_clave(b'vacio'), df, colores)
+    assert analizar(conjunto, df.iloc[:0]) == ({}, 0)
+
+
+@pytest.mark.parametrize('tipo_ruta', ['individuales', 'unificadas', 'optimizadas', 'densidad'])
+def test_mapa_sin_coincidencias(dataset, tipo_ruta):
+    df, colores = dataset
+    app = Dash(__name__)
+    app.layout = crear_layout()
+    registrar_callbacks(app)
+    clave = calcular_clave(b'mapa-sin-coincidencias')
+    almacen.guardar(clave, df, colores, persistir=False)
+    # peticion_mapa falla si la respuesta no es 200
+    peticion_mapa(app, app.server.test_client(), clave, tipo_ruta, tecnicos=['NOPE'])
+
+
+def test_optimizar_tramo_cortado_por_tiempo():
+    rng = np.random.default_rng(0)
+    lat, lon = 4.6 + rng.random(60) * 0.1, -74.1 + rng.random(60) * 0.1
+    *_, completo = optimizar_tramo(('t', lat, lon, time.time() - 1))
+    assert not completo
+    *_, completo = optimizar_tramo(('t', lat, lon, time.time() + 60))
+    assert completo
+
+
+def test_rutas_optimizadas_limite_bytes():
+    rutas = RutasOptimizadas(limite_bytes=3 * 8 * 10)
+    for i in range(5):
+        rutas.guardar(i, (np.arange(10), 1.0, 1.0))
+    assert rutas.get(0) is None and rutas.get(1) is None
+    assert rutas.get(4) is not None
+    assert rutas.nbytes == 3 * 8 * 10
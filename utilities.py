@@ -1,13 +1,25 @@
+import json
+import os
+import re
+import unicodedata
 import pandas as pd
 import numpy as np
 import random
 
+RUTA_ALIAS_TECNICOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alias_tecnicos.json')
+
 def parse_coord(coord):
     try:
         return float(str(coord).replace(',', '.').strip())
     except:
         return None
 
+def parse_coord_columna(serie):
+    # parse_coord aplicado solo a los valores distintos de la columna
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    valores = np.array([parse_coord(valor) for valor in unicos], dtype=float)
+    return pd.Series(valores[codigos], index=serie.index, name=serie.name)
+
 def convertir_fechas(fecha_str):
     try:
         fecha_limpia = str(fecha_str).lower().replace("a. m.", "am").replace("p. m.", "pm").strip()
@@ -16,31 +28,112 @@ def convertir_fechas(fecha_str):
     except:
         return pd.NaT
 
-def procesar_datos(df):
-    # Procesamiento de coordenadas
-    df['Tecnico_Clean'] = df['4.Nombre del Técnico Instalador'].str.strip().str.upper()
-    df['Latitud_adj'] = df['Latitud']
-    df['Longitud_adj'] = df['Longitud']
+FORMATOS_FECHA = ('%d/%m/%Y %I:%M:%S %p', '%d/%m/%Y %H:%M:%S')
+
+def convertir_fechas_columna(serie):
+    # Versión por columnas de convertir_fechas: cada valor distinto se normaliza
+    # y se parsea una sola vez, con una llamada a pd.to_datetime por formato y
+    # reintentando solo las filas que fallaron. Devuelve las fechas y cuántas
+    # filas reconoció cada formato.
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    repeticiones = np.bincount(codigos, minlength=len(unicos))
+    texto = (
+        pd.Series([str(valor) for valor in unicos], dtype=object)
+        .str.lower()
+        .str.replace("a. m.", "am", regex=False)
+        .str.replace("p. m.", "pm", regex=False)
+        .str.strip()
+    )
     
-    groups = df.groupby(['Latitud', 'Longitud'])
-    for (lat, lon), group in groups:
-        if len(group) > 1:
-            for i, idx in enumerate(group.index[1:]):
-                angle = np.random.uniform(0, 2 * np.pi)
-                delta_lat = (5 / 111320) * np.cos(angle)
-                delta_lon = (5 / (111320 * np.cos(np.radians(lat)))) * np.sin(angle)
-                df.at[idx, 'Latitud_adj'] = lat + delta_lat
-                df.at[idx, 'Longitud_adj'] = lon + delta_lon
+    parseadas = pd.Series(pd.NaT, index=texto.index, dtype='datetime64[ns]')
+    pendientes = np.ones(len(texto), dtype=bool)
+    conteo = {}
+    for formato in FORMATOS_FECHA:
+        if not pendientes.any():
+            conteo[formato] = 0
+            continue
+        intento = pd.to_datetime(texto[pendientes], format=formato, errors='coerce')
+        validas = intento.notna().to_numpy()
+        posiciones = np.flatnonzero(pendientes)[validas]
+        parseadas.iloc[posiciones] = intento[validas].to_numpy()
+        pendientes[posiciones] = False
+        conteo[formato] = int(repeticiones[posiciones].sum())
+    conteo['sin_formato'] = int(repeticiones[pendientes].sum())
     
-    df["Latitud"] = df["Latitud"].apply(parse_coord)
-    df["Longitud"] = df["Longitud"].apply(parse_coord)
-    df = df.dropna(subset=["Latitud", "Longitud"])
-    df = df[(df["Latitud"] > 0) & (df["Longitud"] < 0)]
-    df['FechaCreacion'] = df['FechaCreacion'].apply(convertir_fechas)
+    fechas = pd.Series(parseadas.to_numpy()[codigos], index=serie.index, name=serie.name)
+    return fechas, conteo
+
+def eliminar_tildes(texto):
+    try:
+        texto = unicodedata.normalize('NFKD', texto)
+        texto = texto.encode('ASCII', 'ignore').decode('ASCII')
+    except:
+        pass
+    return texto.upper()
+
+def limpiar_nombre_tecnico(texto):
+    texto = eliminar_tildes(str(texto)).strip()  # Elimina espacios al inicio/final
+    texto = re.sub(r'\s+', ' ', texto)  # Unifica múltiples espacios
+    return re.sub(r'[^A-Z ]', '', texto)  # Elimina caracteres especiales
+
+def cargar_alias(ruta=RUTA_ALIAS_TECNICOS):
+    # Tabla {variante: nombre canónico}; ambas partes se limpian igual que los datos
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding='utf-8') as archivo:
+        alias = json.load(archivo)
+    return {limpiar_nombre_tecnico(k): limpiar_nombre_tecnico(v) for k, v in alias.items()}
+
+def normalizar_tecnicos(serie, alias=None):
+    # Limpia solo los nombres distintos y devuelve una columna categórica
+    if alias is None:
+        alias = cargar_alias()
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    limpios = [limpiar_nombre_tecnico(valor) for valor in unicos]
+    limpios = [alias.get(nombre, nombre) for nombre in limpios]
+    categorias = sorted(set(limpios))
+    posiciones = pd.Index(categorias).get_indexer(limpios)
+    return pd.Series(
+        pd.Categorical.from_codes(posiciones[codigos], categories=categorias),
+        index=serie.index,
+        name='Tecnico_Clean'
+    )
+
+METROS_POR_GRADO = 111320
+
+def ajustar_coordenadas(df, modo='espiral', radio_m=5, semilla=None, previos=None):
+    # Separa los puntos que comparten coordenadas. Debe ejecutarse después de
+    # parse_coord para que "4,5" y 4.5 caigan en el mismo grupo. previos indica,
+    # por fila, cuántos puntos con esas coordenadas existían ya en el dataset.
+    lat = df['Latitud'].to_numpy(dtype=float)
+    lon = df['Longitud'].to_numpy(dtype=float)
+    orden = df.groupby(['Latitud', 'Longitud'], sort=False).cumcount().to_numpy()
+    if previos is not None:
+        orden = orden + previos
+    repetidos = orden > 0
+    k = orden[repetidos]
     
-    # Generar colores
-    tecnicos = sorted(df['Tecnico_Clean'].dropna().unique())
-    colores = {t: f"rgb({random.randint(0,255)},{random.randint(0,255)},{random.randint(0,255)})" 
-              for t in tecnicos}
+    if modo == 'espiral':
+        # Anillos concéntricos: el anillo r aloja 6*r puntos a r*radio_m metros
+        anillo = np.ceil((np.sqrt(9 + 12 * k) - 3) / 6 - 1e-9)
+        posicion = k - 3 * anillo * (anillo - 1) - 1
+        angulo = 2 * np.pi * posicion / (6 * anillo)
+        distancia = radio_m * anillo
+    elif modo == 'aleatorio':
+        rng = np.random.default_rng(semilla)
+        angulo = rng.uniform(0, 2 * np.pi, k.size)
+        distancia = radio_m
+    else:
+        raise ValueError(f"Modo de ajuste desconocido: {modo}")
     
-    return df, colores
\ No newline at end of file
+    lat_adj = lat.copy()
+    lon_adj = lon.copy()
+    lat_adj[repetidos] += (distancia / METROS_POR_GRADO) * np.cos(angulo)
+    lon_adj[repetidos] += (
+        distancia / (METROS_POR_GRADO * np.cos(np.radians(lat[repetidos])))
+    ) * np.sin(angulo)
+    return df.assign(Latitud_adj=lat_adj, Longitud_adj=lon_adj)
+
+def generar_colores(tecnicos):
+    return {t: f"rgb({random.randint(0,255)},{random.randint(0,255)},{random.randint(0,255)})"
+            for t in tecnicos}
@@ -0,0 +1,18 @@
+# Punto de entrada de producción:
+#   gunicorn -c gunicorn.conf.py wsgi:server
+# Con preload_app el proceso maestro importa este módulo una sola vez y los
+# workers heredan pandas, plotly y la app ya cargados al hacer fork.
+import pandas as pd
+import plotly.graph_objects as go
+
+from app import app, server
+
+
+def precalentar():
+    # plotly carga sus validadores y pandas sus parsers de fechas la primera
+    # vez que se usan; así no lo paga el primer callback de cada worker
+    go.Figure(go.Scattermapbox(lat=[0], lon=[0])).to_plotly_json()
+    pd.to_datetime(pd.Series(['01/01/2024 08:00:00']), format='%d/%m/%Y %H:%M:%S')
+
+
+precalentar()